@@ -14,17 +14,31 @@
 #
 
 # pylint: disable=attribute-defined-outside-init
+import io
+import mmap
 import os
+import posixpath
+import shutil
+import subprocess
 import time
 import tarfile
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 
 from devlib.module import FlashModule
 from devlib.exception import HostError
 from devlib.utils.android import fastboot_flash_partition, fastboot_command
 from devlib.utils.misc import merge_dicts, safe_extract
-from typing import (TYPE_CHECKING, Any, Optional, Dict, List, cast)
+try:
+    import fastar
+except ImportError:
+    fastar = None
+
+from typing import (TYPE_CHECKING, Any, Optional, Dict, Iterable, Iterator, List, Set, cast)
+from typing_extensions import Literal
 if TYPE_CHECKING:
+    from concurrent.futures import Future
     from devlib.target import Target, AndroidTarget
 
 
@@ -48,10 +62,23 @@ class FastbootFlashModule(FlashModule):
         kernel zImage-dtb
         ramdisk ramdisk_image
 
+    Blank lines and lines starting with ``#`` are ignored.
+
+    Only the images listed in ``partitions.txt`` are extracted from the bundle. They are
+    extracted to RAM-backed storage (``/dev/shm``) when it has enough room, as fastboot
+    needs a file to flash from and cannot read the images from a pipe.
+
+    If the bundle follows the AOSP product output layout, i.e. it contains an
+    ``android-info.txt`` and each image is named ``<partition>.img`` after a standard
+    partition, all images are flashed with a single ``fastboot flashall``. Set
+    ``prefer_flashall`` to ``False`` to always flash partitions one by one.
+
     """
 
     delay: float = 0.5
     partitions_file_name: str = 'partitions.txt'
+    android_info_file_name: str = 'android-info.txt'
+    prefer_flashall: bool = True
 
     @staticmethod
     def probe(target: 'Target') -> bool:
@@ -63,44 +90,143 @@ class FastbootFlashModule(FlashModule):
         if bootargs:
             raise ValueError('{} does not support boot configuration'.format(self.name))
         self.prelude_done: bool = False
-        to_flash: Dict[str, str] = {}
-        if image_bundle:  # pylint: disable=access-member-before-definition
-            image_bundle = expand_path(image_bundle)
-            to_flash = self._bundle_to_images(image_bundle)
-        to_flash = merge_dicts(to_flash, images or {}, should_normalize=False)
-        for partition, image_path in to_flash.items():
-            self.logger.debug('flashing {}'.format(partition))
-            self._flash_image(cast('AndroidTarget', self.target), partition, expand_path(image_path))
+        self._extract_dir: Optional[str] = None
+        try:
+            to_flash: Dict[str, str] = {}
+            product_out: Optional[str] = None
+            if image_bundle:  # pylint: disable=access-member-before-definition
+                image_bundle = expand_path(image_bundle)
+                to_flash = self._bundle_to_images(image_bundle)
+                if self.prefer_flashall and not images:
+                    product_out = self._get_product_out(to_flash)
+            images = {partition: expand_path(image_path) for partition, image_path in (images or {}).items()}
+            to_flash = merge_dicts(to_flash, images, should_normalize=False)
+            # Check every image before the target is reset into fastboot mode, so
+            # that a bad path does not leave the device half-flashed.
+            for partition, image_path in to_flash.items():
+                if not os.path.isfile(image_path):
+                    raise HostError('Image {} for partition {} is not a file'.format(image_path, partition))
+            target = cast('AndroidTarget', self.target)
+            if product_out is None or not self._flashall(target, product_out):
+                self._flash_images(target, to_flash)
+        finally:
+            if self._extract_dir:
+                shutil.rmtree(self._extract_dir, ignore_errors=True)
         fastboot_command('reboot')
         if connect:
             self.target.connect(timeout=180)
 
-    def _validate_image_bundle(self, image_bundle: str) -> None:
+    def _get_product_out(self, to_flash: Dict[str, str]) -> Optional[str]:
+        """
+        Return the directory holding the images if it can be flashed with
+        ``fastboot flashall``, i.e. if it is laid out like an AOSP product output
+        directory with exactly the images to flash, and ``None`` otherwise.
+        """
+        dirs = {os.path.dirname(image_path) for image_path in to_flash.values()}
+        if len(dirs) != 1:
+            return None
+        product_out = dirs.pop()
+        if not os.path.isfile(os.path.join(product_out, self.android_info_file_name)):
+            return None
+        for partition, image_path in to_flash.items():
+            if partition not in AOSP_PARTITIONS or os.path.basename(image_path) != '{}.img'.format(partition):
+                return None
+        return product_out
+
+    def _flashall(self, target: 'AndroidTarget', product_out: str) -> bool:
+        """
+        flash all the images in ``product_out`` with a single fastboot invocation.
+        Returns ``False`` if that failed and images should be flashed one by one.
+        """
+        if not self.prelude_done:
+            self._fastboot_prelude(target)
+        self.logger.debug('flashing all images from {}'.format(product_out))
+        try:
+            fastboot_command('--skip-reboot flashall', env=dict(os.environ, ANDROID_PRODUCT_OUT=product_out))
+        except (HostError, subprocess.CalledProcessError) as e:
+            self.logger.warning('fastboot flashall failed, flashing partitions one by one: {}'.format(e))
+            return False
+        return True
+
+    def _flash_images(self, target: 'AndroidTarget', to_flash: Dict[str, str]) -> None:
         """
-        make sure the image bundle is a tarfile and it can be opened and it contains the
-        required partition file
+        flash all the images, in order. Flashes are serialized over the USB
+        link, so the next image is staged on the host while the current one
+        is being written to the device.
         """
-        if not tarfile.is_tarfile(image_bundle):
-            raise HostError('File {} is not a tarfile'.format(image_bundle))
-        with tarfile.open(image_bundle) as tar:
-            files: List[str] = [tf.name for tf in tar.getmembers()]
-            if not any(pf in files for pf in (self.partitions_file_name, '{}/{}'.format(files[0], self.partitions_file_name))):
-                HostError('Image bundle does not contain the required partition file (see documentation)')
+        items = list(to_flash.items())
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            staged: Optional['Future[str]'] = pool.submit(self._stage_image, items[0][1]) if items else None
+            for i, (partition, _) in enumerate(items):
+                image_path = cast('Future[str]', staged).result()
+                if i + 1 < len(items):
+                    staged = pool.submit(self._stage_image, items[i + 1][1])
+                self.logger.debug('flashing {}'.format(partition))
+                self._flash_image(target, partition, image_path)
 
     def _bundle_to_images(self, image_bundle: str) -> Dict[str, str]:
         """
         Extracts the bundle to a temporary location and creates a mapping between the contents of the bundle
         and images to be flashed.
+
+        The bundle is opened only once. The partition file is read straight from the
+        archive and checked against its content, so that a broken bundle is detected
+        before anything is extracted and only the images it references are extracted.
+        """
+        with _open_bundle(image_bundle) as tar:
+            files: List[str] = tar.getnames()
+            names: Set[str] = set(files)
+            prefix = ''
+            if self.partitions_file_name not in names:
+                prefix = '{}/'.format(files[0]) if files else ''
+                if not files or prefix + self.partitions_file_name not in names:
+                    raise HostError('Image bundle does not contain the required partition file (see documentation)')
+            partitions_member = prefix + self.partitions_file_name
+            pf = tar.extractfile(partitions_member)
+            if pf is None:
+                raise HostError('{} in the image bundle is not a regular file'.format(partitions_member))
+            with pf:
+                images = parse_partitions(io.TextIOWrapper(pf, encoding='utf-8'))
+            # Make sure every image is in the bundle before extracting anything
+            members_by_name = {posixpath.normpath(m.name): m for m in tar.getmembers()}
+            for image in images.values():
+                member = members_by_name.get(posixpath.normpath(prefix + image))
+                if member is None or member.isdir():
+                    raise HostError('file {} was not found in the bundle or was misplaced'.format(image))
+            wanted = {posixpath.normpath(prefix + name) for name in images.values()}
+            if self.prefer_flashall:
+                wanted.add(posixpath.normpath(prefix + self.android_info_file_name))
+            # Keep the archive order so compressed bundles are decompressed in a single pass
+            members = [m for m in tar.getmembers() if posixpath.normpath(m.name) in wanted]
+            extract_size = sum(m.size for m in members)
+            extract_dir: str = tempfile.mkdtemp(dir=_pick_extract_root(extract_size))
+            self._extract_dir = extract_dir
+            wanted.add(posixpath.normpath(partitions_member))
+            needs_all = all(posixpath.normpath(m.name) in wanted for m in tar.getmembers() if m.isfile())
+            if needs_all and fastar is not None and _bundle_compression(image_bundle) in ('', 'gz'):
+                self._unpack_with_fastar(tar, image_bundle, extract_dir)
+            elif hasattr(tarfile, 'data_filter'):
+                # The 'data' filter does the same sanitization as safe_extract()
+                # (and more), without a separate pass over the members.
+                tar.extractall(path=extract_dir, members=members, filter='data')
+            else:
+                safe_extract(tar, path=extract_dir, members=members)
+        return {partition: os.path.normpath(os.path.join(extract_dir, prefix, image))
+                for partition, image in images.items()}
+
+    def _unpack_with_fastar(self, tar: tarfile.TarFile, image_bundle: str, extract_dir: str) -> None:
+        """
+        Unpack the whole bundle using the native fastar extractor. The member
+        names are checked against path traversal beforehand, as
+        :func:`~devlib.utils.misc.safe_extract` does.
         """
-        self._validate_image_bundle(image_bundle)
-        extract_dir: str = tempfile.mkdtemp()
-        with tarfile.open(image_bundle) as tar:
-            safe_extract(tar, path=extract_dir)
-            files: List[str] = [tf.name for tf in tar.getmembers()]
-            if self.partitions_file_name not in files:
-                extract_dir = os.path.join(extract_dir, files[0])
-        partition_file: str = os.path.join(extract_dir, self.partitions_file_name)
-        return get_mapping(extract_dir, partition_file)
+        root = os.path.abspath(extract_dir)
+        for name in tar.getnames():
+            if os.path.commonpath([root, os.path.abspath(os.path.join(root, name))]) != root:
+                raise HostError('Attempted Path Traversal in Tar File')
+        self.logger.debug('Unpacking {} using fastar'.format(image_bundle))
+        with fastar.open(image_bundle, 'r') as archive:
+            archive.unpack(extract_dir)
 
     def _flash_image(self, target: 'AndroidTarget', partition: str, image_path: str) -> None:
         """
@@ -109,16 +235,155 @@ class FastbootFlashModule(FlashModule):
         if not self.prelude_done:
             self._fastboot_prelude(target)
         fastboot_flash_partition(partition, image_path)
-        time.sleep(self.delay)
+
+    @staticmethod
+    def _stage_image(image_path: str) -> str:
+        """
+        Ask the kernel to start reading the (already expanded) image into the
+        page cache, so that fastboot does not have to wait on the disk.
+        """
+        if hasattr(os, 'posix_fadvise'):
+            fd = os.open(image_path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+        return image_path
 
     def _fastboot_prelude(self, target: 'AndroidTarget') -> None:
         target.reset(fastboot=True)
-        time.sleep(self.delay)
+        self._wait_ready()
         self.prelude_done = True
 
+    def _wait_ready(self, timeout: Optional[float] = None, poll: float = 0.02) -> None:
+        """
+        Wait for the device to be listed by fastboot, polling with an exponential
+        backoff starting at ``poll`` seconds. Gives up after ``timeout`` seconds
+        (``delay`` by default), leaving fastboot to wait for the device itself.
+        """
+        deadline = time.monotonic() + (self.delay if timeout is None else timeout)
+        while True:
+            try:
+                if 'fastboot' in fastboot_command('devices'):
+                    return
+            except (HostError, subprocess.CalledProcessError):
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(poll, remaining))
+            poll *= 2
+
 
 # utility functions
 
+# Partitions ``fastboot flashall`` always flashes from an AOSP product output
+# directory. super, userdata and cache are left out on purpose: flashall skips
+# them (or flashes them differently), so bundles containing them are flashed
+# partition by partition.
+AOSP_PARTITIONS: Set[str] = {
+    'boot', 'init_boot', 'vendor_boot', 'vendor_kernel_boot', 'dtbo', 'pvmfw',
+    'recovery', 'vbmeta', 'vbmeta_system', 'vbmeta_vendor',
+    'system', 'system_ext', 'system_dlkm', 'product', 'vendor', 'vendor_dlkm',
+    'odm', 'odm_dlkm',
+}
+
+def _pick_extract_root(size: int) -> Optional[str]:
+    """
+    Pick a RAM backed directory to extract ``size`` bytes of images to, if one
+    has plenty of room, so the images are not written to disk only to be read
+    back by fastboot. Returns ``None`` to use the default temporary directory.
+    """
+    roots = ['/dev/shm']
+    if hasattr(os, 'getuid'):
+        roots.append('/run/user/{}'.format(os.getuid()))
+    for root in roots:
+        if os.path.isdir(root) and os.access(root, os.W_OK):
+            try:
+                if shutil.disk_usage(root).free > size * 2:
+                    return root
+            except OSError:
+                pass
+    return None
+
+
+# Bundles larger than this are mapped in memory rather than read through
+# buffered I/O, letting the kernel handle readahead.
+BUNDLE_MMAP_THRESHOLD: int = 64 * 1024 * 1024
+BUNDLE_COPY_BUFSIZE: int = 1024 * 1024
+
+
+class _BundleMap(mmap.mmap):
+    """
+    Read-only memory map usable as a file object by all the tarfile
+    decompressors, some of which require ``seekable()``.
+    """
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+
+@contextmanager
+def _open_bundle(path: str) -> Iterator[tarfile.TarFile]:
+    """
+    Open an image bundle for reading, whatever its compression.
+    """
+    compression = _bundle_compression(path)
+    mode: Literal['r:', 'r:gz', 'r:bz2', 'r:xz', 'r:*']
+    if compression == '':
+        mode = 'r:'
+    elif compression == 'gz':
+        mode = 'r:gz'
+    elif compression == 'bz2':
+        mode = 'r:bz2'
+    elif compression == 'xz':
+        mode = 'r:xz'
+    else:
+        # Let tarfile detect formats the sniffing does not recognize, such as
+        # pre-POSIX tarballs.
+        mode = 'r:*'
+    with ExitStack() as stack:
+        fileobj: Optional[_BundleMap] = None
+        if os.path.getsize(path) > BUNDLE_MMAP_THRESHOLD:
+            raw = stack.enter_context(open(path, 'rb'))
+            fileobj = stack.enter_context(_BundleMap(raw.fileno(), 0, access=mmap.ACCESS_READ))
+        try:
+            tar = tarfile.open(None if fileobj else path, mode=mode, fileobj=fileobj)
+        except tarfile.ReadError as e:
+            raise HostError('File {} is not a tarfile: {}'.format(path, e))
+        # Partition images are typically hundreds of MiB, copy them out in
+        # larger chunks than tarfile's 16KiB default.
+        tar.copybufsize = BUNDLE_COPY_BUFSIZE  # type: ignore[attr-defined]
+        with tar:
+            yield tar
+
+
+# Magic bytes at the start of each compressed format tarfile can read.
+_BUNDLE_MAGIC: Dict[str, bytes] = {
+    'gz': b'\x1f\x8b',
+    'bz2': b'BZh',
+    'xz': b'\xfd7zXZ\x00',
+}
+
+
+def _bundle_compression(path: str) -> Optional[str]:
+    """
+    Guess the compression of a tarball from its first block, without going
+    through the decompressors. Returns ``''`` for an uncompressed POSIX
+    tarball and ``None`` if the format could not be recognized.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(tarfile.BLOCKSIZE)
+    for compression, magic in _BUNDLE_MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    if head[257:262] == b'ustar':
+        return ''
+    return None
+
+
 def expand_path(original_path: str) -> str:
     """
     expand ~ and ~user in the path
@@ -129,18 +394,33 @@ def expand_path(original_path: str) -> str:
     return path
 
 
+def parse_partitions(lines: Iterable[str]) -> Dict[str, str]:
+    """
+    parse the lines of a partition txt file into a mapping of partition to image name
+    """
+    mapping: Dict[str, str] = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        pair = line.split(None, 1)
+        if len(pair) != 2:
+            raise HostError('partitions.txt is not properly formated')
+        mapping[pair[0]] = pair[1]
+    return mapping
+
+
 def get_mapping(base_dir: str, partition_file: str) -> Dict[str, str]:
     """
-    get the image and partition mapping info from partition txt file
+    get the image and partition mapping info from partition txt file. The
+    returned image paths are already expanded.
     """
     mapping: Dict[str, str] = {}
+    base_dir = expand_path(base_dir)
     with open(partition_file) as pf:
-        for line in pf:
-            pair = line.split()
-            if len(pair) != 2:
-                HostError('partitions.txt is not properly formated')
-            image_path = os.path.join(base_dir, pair[1])
-            if not os.path.isfile(expand_path(image_path)):
-                HostError('file {} was not found in the bundle or was misplaced'.format(pair[1]))
-            mapping[pair[0]] = image_path
+        for partition, image in parse_partitions(pf).items():
+            image_path = os.path.normpath(os.path.join(base_dir, image))
+            if not os.path.isfile(image_path):
+                raise HostError('file {} was not found in the bundle or was misplaced'.format(image))
+            mapping[partition] = image_path
     return mapping
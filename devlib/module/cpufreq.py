@@ -13,21 +13,105 @@
 # limitations under the License.
 #
 
+from shlex import quote
+
 from devlib.module import Module
-from devlib.exception import TargetStableError
+from devlib.exception import TargetError, TargetStableError
 from devlib.utils.misc import memoized
 import devlib.utils.asyn as asyn
-from typing import (TYPE_CHECKING, Dict, List, Tuple, Union,
-                    cast, Optional, Any, Set, Coroutine)
+from typing import (TYPE_CHECKING, Callable, Dict, FrozenSet, Iterable, List,
+                    Tuple, Union, cast, Optional, Any, Set)
 from collections.abc import AsyncGenerator
 if TYPE_CHECKING:
     from devlib.target import Target
 
-# a dict of governor name and a list of it tunables that can't be read
-WRITE_ONLY_TUNABLES: Dict[str, List[str]] = {
-    'interactive': ['boostpulse']
+# a dict of governor name and a set of it tunables that can't be read
+WRITE_ONLY_TUNABLES: Dict[str, FrozenSet[str]] = {
+    'interactive': frozenset({'boostpulse'})
 }
 
+_CPU_NAMES: Dict[int, str] = {}
+
+
+def _cpu_str(cpu: Union[int, str]) -> str:
+    """
+    Turn a cpu number into the corresponding sysfs name, e.g. ``1`` into
+    ``"cpu1"``. Strings are returned unchanged.
+    """
+    if isinstance(cpu, str):
+        return cpu
+    try:
+        return _CPU_NAMES[cpu]
+    except KeyError:
+        return _CPU_NAMES.setdefault(cpu, 'cpu{}'.format(cpu))
+
+# Governor tunables listings, shared by all the module instances talking to the
+# same system: system ID -> governor name -> (governor, per_cpu, tunables)
+_GOVERNOR_TUNABLES_CACHE: Dict[str, Dict[str, Tuple[str, bool, Tuple[str, ...]]]] = {}
+
+
+# sysfs path builders, taking CPU names as returned by _cpu_str()
+_CPU_SYSFS: str = '/sys/devices/system/cpu/'
+
+
+def _p_cpufreq(cpu: str, sysfile: str) -> str:
+    return f'{_CPU_SYSFS}{cpu}/cpufreq/{sysfile}'
+
+
+def _p_scaling_min(cpu: str) -> str:
+    return f'{_CPU_SYSFS}{cpu}/cpufreq/scaling_min_freq'
+
+
+def _p_scaling_max(cpu: str) -> str:
+    return f'{_CPU_SYSFS}{cpu}/cpufreq/scaling_max_freq'
+
+
+def _p_scaling_cur(cpu: str) -> str:
+    return f'{_CPU_SYSFS}{cpu}/cpufreq/scaling_cur_freq'
+
+
+def _p_scaling_gov(cpu: str) -> str:
+    return f'{_CPU_SYSFS}{cpu}/cpufreq/scaling_governor'
+
+
+def _p_scaling_setspeed(cpu: str) -> str:
+    return f'{_CPU_SYSFS}{cpu}/cpufreq/scaling_setspeed'
+
+
+def _p_affected(cpu: str) -> str:
+    return f'{_CPU_SYSFS}{cpu}/cpufreq/affected_cpus'
+
+
+def _p_related(cpu: str) -> str:
+    return f'{_CPU_SYSFS}{cpu}/cpufreq/related_cpus'
+
+
+def _p_driver(cpu: str) -> str:
+    return f'{_CPU_SYSFS}{cpu}/cpufreq/scaling_driver'
+
+
+def _p_gov_dir(cpu: str, governor: str, per_cpu: bool = True) -> str:
+    if per_cpu:
+        return f'{_CPU_SYSFS}{cpu}/cpufreq/{governor}'
+    else:
+        # On old kernels
+        return f'{_CPU_SYSFS}cpufreq/{governor}'
+
+
+def _p_gov_tunable(cpu: str, governor: str, tunable: str, per_cpu: bool = True) -> str:
+    if per_cpu:
+        return f'{_CPU_SYSFS}{cpu}/cpufreq/{governor}/{tunable}'
+    else:
+        return f'{_CPU_SYSFS}cpufreq/{governor}/{tunable}'
+
+
+def _unique_cpus(cpus: Iterable[Union[int, str]]) -> List[Union[int, str]]:
+    """
+    Deduplicate a list of CPUs, sorting it if there is more than one.
+    """
+    unique = set(cpus)
+    return sorted(unique) if len(unique) > 1 else list(unique)
+
 
 class CpufreqModule(Module):
     """
@@ -42,6 +126,12 @@ class CpufreqModule(Module):
             interface (which is what is used by the ``devlib`` module) on the
             first cpu in a cluster. So to keep your scripts portable, always use
             the fist (online) CPU in a cluster to set ``cpufreq`` state.
+
+    .. note:: Every getter and setter runs one command on the target, which
+            opens the sysfs file afresh. There is no persistent process on the
+            target that could keep the files open between calls, so code
+            polling several CPUs should prefer the bulk helpers such as
+            :meth:`get_all_frequencies` and :meth:`get_all_governors`.
     """
     name: str = 'cpufreq'
 
@@ -61,16 +151,88 @@ class CpufreqModule(Module):
             if path[0]
         ]
 
-        exists = await target.async_manager.map_concurrently(
-            target.file_exists.asyn,
-            paths,
-        )
-
-        return any(exists.values())
+        return await target.file_exists_any.asyn(paths)
 
     def __init__(self, target: 'Target'):
         super(CpufreqModule, self).__init__(target)
-        self._governor_tunables: Dict[str, Tuple[str, bool, List[str]]] = {}
+        # Resolved lazily to the entry of _GOVERNOR_TUNABLES_CACHE matching
+        # the target's system
+        self._governor_tunables: Optional[Dict[str, Tuple[str, bool, Tuple[str, ...]]]] = None
+        # CPUs of each cpufreq policy, if the kernel exposes policy directories
+        self._policies_cpus: Optional[List[List[int]]] = None
+        # Values of the static per-policy files read at once for all the CPUs:
+        # sysfs file name -> cpu name -> parsed value
+        self._static_values: Dict[str, Dict[str, Any]] = {}
+        # Online CPUs of each cpufreq policy, until the next hotplug
+        self._affected_cpus: Dict[str, List[int]] = {}
+        self._prime_static_caches()
+
+    @asyn.asyncf
+    async def _prime_static_caches(self) -> None:
+        """
+        Read the files backing :meth:`list_governors`, :meth:`list_frequencies`,
+        :meth:`get_related_cpus` and :meth:`get_driver` for all the CPUs at
+        once, reading the files only once per cpufreq policy. This is only an
+        optimization: if anything goes wrong, the methods read the files
+        themselves.
+        """
+        base: str = '/sys/devices/system/cpu/cpufreq'
+        parsers: Dict[str, Callable[[str], Any]] = {
+            'related_cpus': lambda v: [int(c) for c in v.split()],
+            'scaling_available_governors': lambda v: v.split(),
+            'scaling_available_frequencies': lambda v: sorted(map(int, v.split())),
+            'scaling_driver': lambda v: v,
+        }
+        try:
+            policies: List[str] = [
+                name
+                for name in await self.target.list_directory.asyn(base)
+                if name.startswith('policy')
+            ]
+            if not policies:
+                return
+            policies.sort(key=lambda name: int(name[len('policy'):]))
+
+            paths: Dict[Tuple[str, str], str] = {
+                (policy, sysfile): self.target.path.join(base, policy, sysfile)
+                for policy in policies
+                for sysfile in parsers
+            }
+            values: Dict[str, Optional[str]] = await self._batch_read_values.asyn(paths.values())
+
+            static_values: Dict[str, Dict[str, Any]] = {sysfile: {} for sysfile in parsers}
+            policies_cpus: Optional[List[List[int]]] = []
+            for policy in policies:
+                related: Optional[str] = values[paths[policy, 'related_cpus']]
+                if related is None:
+                    # The domains cannot be enumerated from the policies alone
+                    policies_cpus = None
+                    continue
+                cpus: List[int] = [int(c) for c in related.split()]
+                if policies_cpus is not None:
+                    policies_cpus.append(cpus)
+                for sysfile, parse in parsers.items():
+                    value: Optional[str] = values[paths[policy, sysfile]]
+                    if value is None:
+                        continue
+                    parsed: Any = parse(value)
+                    for cpu in cpus:
+                        static_values[sysfile].setdefault(_cpu_str(cpu), parsed)
+        except (TargetError, ValueError) as e:
+            # Older kernels only expose the per-cpu interface, and there is
+            # nothing to gain from priming if the target is misbehaving.
+            self.logger.debug('Could not prime cpufreq caches: {}'.format(e))
+            return
+
+        self._static_values = static_values
+        self._policies_cpus = policies_cpus
+
+    def _get_static_value(self, sysfile: str, cpu: str) -> Any:
+        """
+        Value of ``sysfile`` for ``cpu`` read by :meth:`_prime_static_caches`,
+        or ``None`` if it was not read.
+        """
+        return self._static_values.get(sysfile, {}).get(cpu)
 
     @asyn.asyncf
     @asyn.memoized_method
@@ -81,9 +243,11 @@ class CpufreqModule(Module):
         :param cpu: The cpu; could be a numeric or the corresponding string (e.g.
                     ``1`` or ``"cpu1"``).
         """
-        if isinstance(cpu, int):
-            cpu = 'cpu{}'.format(cpu)
-        sysfile: str = '/sys/devices/system/cpu/{}/cpufreq/scaling_available_governors'.format(cpu)
+        cpu = _cpu_str(cpu)
+        governors: Optional[List[str]] = self._get_static_value('scaling_available_governors', cpu)
+        if governors is not None:
+            return governors
+        sysfile: str = _p_cpufreq(cpu, 'scaling_available_governors')
         output: str = await self.target.read_value.asyn(sysfile)
         return output.strip().split()
 
@@ -95,9 +259,8 @@ class CpufreqModule(Module):
         :param cpu: The cpu; could be a numeric or the corresponding string (e.g.
                     ``1`` or ``"cpu1"``).
         """
-        if isinstance(cpu, int):
-            cpu = 'cpu{}'.format(cpu)
-        sysfile: str = '/sys/devices/system/cpu/{}/cpufreq/scaling_governor'.format(cpu)
+        cpu = _cpu_str(cpu)
+        sysfile: str = _p_scaling_gov(cpu)
         return await self.target.read_value.asyn(sysfile)
 
     @asyn.asyncf
@@ -122,12 +285,15 @@ class CpufreqModule(Module):
                  for some reason, the governor could not be set.
 
         """
-        if isinstance(cpu, int):
-            cpu = 'cpu{}'.format(cpu)
+        cpu = _cpu_str(cpu)
         supported: List[str] = await self.list_governors.asyn(cpu)
         if governor not in supported:
             raise TargetStableError('Governor {} not supported for cpu {}'.format(governor, cpu))
-        sysfile = '/sys/devices/system/cpu/{}/cpufreq/scaling_governor'.format(cpu)
+        # Writing the governor again restarts it, so avoid that when there is
+        # nothing to change.
+        if not kwargs and await self.get_governor.asyn(cpu) == governor:
+            return
+        sysfile = _p_scaling_gov(cpu)
         await self.target.write_value.asyn(sysfile, governor)
         await self.set_governor_tunables.asyn(cpu, governor, **kwargs)
 
@@ -145,17 +311,7 @@ class CpufreqModule(Module):
         if not cpus:
             cpus = await self.target.list_online_cpus.asyn()
 
-        async def get_cpu_info(cpu) -> List[Any]:
-            return await self.target.async_manager.concurrently((
-                self.get_affected_cpus.asyn(cpu),
-                self.get_governor.asyn(cpu),
-                self.get_governor_tunables.asyn(cpu),
-                # We won't always use the frequency, but it's much quicker to
-                # do concurrently anyway so do it now
-                self.get_frequency.asyn(cpu),
-            ))
-
-        cpus_infos: Dict[int, List[Any]] = await self.target.async_manager.map_concurrently(get_cpu_info, cpus)
+        cpus_infos: Dict[int, List[Any]] = await self._snapshot_cpus.asyn(cpus)
 
         # Setting a governor & tunables for a cpu will set them for all cpus in
         # the same cpufreq policy, so only manipulating one cpu per domain is
@@ -181,11 +337,11 @@ class CpufreqModule(Module):
                 if prev_gov == "userspace":
                     await self.set_frequency.asyn(cpu, freq)
 
-            per_cpu_tunables: Coroutine = self.target.async_manager.concurrently(
-                set_per_cpu_tunables(cpu)
-                for cpu in domains
-            )
-            per_cpu_tunables.__qualname__ = 'CpufreqModule.use_governor.<locals>.per_cpu_tunables'
+            async def per_cpu_tunables() -> None:
+                await self.target.async_manager.concurrently(
+                    set_per_cpu_tunables(cpu)
+                    for cpu in domains
+                )
 
             # Non-per-cpu tunables have to be set one after the other, for each
             # governor that we had to deal with.
@@ -194,11 +350,11 @@ class CpufreqModule(Module):
                 for cpu, (domain, prev_gov, tunables, freq) in cpus_infos.items()
             }
 
-            global_tunables: Coroutine = self.target.async_manager.concurrently(
-                self.set_governor_tunables.asyn(cpu, gov, per_cpu=False, **tunables)
-                for gov, (cpu, tunables) in global_tunables_dict.items()
-            )
-            global_tunables.__qualname__ = 'CpufreqModule.use_governor.<locals>.global_tunables'
+            async def global_tunables() -> None:
+                await self.target.async_manager.concurrently(
+                    self.set_governor_tunables.asyn(cpu, gov, per_cpu=False, **tunables)
+                    for gov, (cpu, tunables) in global_tunables_dict.items()
+                )
 
             # Set the governor first
             await self.target.async_manager.concurrently(
@@ -208,48 +364,130 @@ class CpufreqModule(Module):
             # And then set all the tunables concurrently. Each task has a
             # specific and non-overlapping set of file to write.
             await self.target.async_manager.concurrently(
-                (per_cpu_tunables, global_tunables)
+                (per_cpu_tunables(), global_tunables())
             )
 
+    @asyn.asyncf
+    async def _snapshot_cpus(self, cpus: List[Union[int, str]]) -> Dict[Any, List[Any]]:
+        """
+        Collect the state needed to restore the cpufreq settings of the given
+        CPUs using a single command on the target.
+
+        :returns: A dict mapping each cpu to a list of its affected CPUs,
+            governor, governor tunables and current frequency. The frequency
+            is only read for the ``userspace`` governor and is ``None``
+            otherwise.
+        """
+        names: Dict[str, Any] = {
+            _cpu_str(cpu): cpu
+            for cpu in cpus
+        }
+        # pylint: disable=protected-access
+        output: str = await self.target._execute_util.asyn(
+            'cpufreq_snapshot {}'.format(' '.join(map(quote, names))),
+            as_root=self.target.needs_su)
+
+        values: Dict[str, Dict[str, Optional[str]]] = {name: {} for name in names}
+        for entry in output.split('\x1e')[1:]:
+            name, _, entry = entry.partition('\x1f')
+            key, sep, value = entry.partition('\x1f')
+            values[name][key] = value.strip() if sep else None
+
+        cpus_infos: Dict[Any, List[Any]] = {}
+        for name, cpu in names.items():
+            cpu_values = values[name]
+            governor: Optional[str] = cpu_values.get('scaling_governor')
+            required: List[str] = ['affected_cpus', 'scaling_governor']
+            if governor == 'userspace':
+                required.append('scaling_cur_freq')
+            for key in required:
+                if cpu_values.get(key) is None:
+                    raise TargetStableError('Could not read {} of {}'.format(key, name))
+            governor = cast(str, cpu_values['scaling_governor'])
+
+            write_only: FrozenSet[str] = WRITE_ONLY_TUNABLES.get(governor, frozenset())
+            tunables: Dict[str, Optional[str]] = {
+                key[len('tunable:'):]: value
+                for key, value in cpu_values.items()
+                if key.startswith('tunable:') and key[len('tunable:'):] not in write_only
+            }
+            unreadable = [tunable for tunable, value in tunables.items() if value is None]
+            if unreadable:
+                raise TargetStableError('Could not read tunables {} of governor {} on {}'.format(
+                    unreadable, governor, name))
+
+            cpus_infos[cpu] = [
+                [int(c) for c in cast(str, cpu_values['affected_cpus']).split()],
+                governor,
+                tunables,
+                int(cast(str, cpu_values['scaling_cur_freq'])) if governor == 'userspace' else None,
+            ]
+        return cpus_infos
+
     @asyn.asyncf
     async def _list_governor_tunables(self, cpu: Union[int, str],
-                                      governor: Optional[str] = None) -> Tuple[str, bool, List[str]]:
+                                      governor: Optional[str] = None) -> Tuple[str, bool, Tuple[str, ...]]:
         """
         helper function for list_governor_tunables
         """
-        if isinstance(cpu, int):
-            cpu = 'cpu{}'.format(cpu)
+        cpu = _cpu_str(cpu)
 
         if governor is None:
             governor = await self.get_governor.asyn(cpu)
 
+        if self._governor_tunables is None:
+            self._governor_tunables = self._get_governor_tunables_cache()
+
         try:
             if not governor:
                 raise TargetStableError
             return self._governor_tunables[governor]
         except KeyError:
-            for per_cpu, path in (
-                (True, '/sys/devices/system/cpu/{}/cpufreq/{}'.format(cpu, governor)),
-                # On old kernels
-                (False, '/sys/devices/system/cpu/cpufreq/{}'.format(governor)),
-            ):
+            async def try_list(path: str) -> Optional[List[str]]:
                 try:
-                    tunables: List[str] = await self.target.list_directory.asyn(path)
+                    return await self.target.list_directory.asyn(path)
                 except TargetStableError:
-                    continue
-                else:
+                    return None
+
+            candidates: List[Tuple[bool, str]] = [
+                (True, _p_gov_dir(cpu, cast(str, governor))),
+                (False, _p_gov_dir(cpu, cast(str, governor), per_cpu=False)),
+            ]
+            # Probe both locations at once, the per-cpu one taking precedence
+            listings: List[Optional[List[str]]] = await self.target.async_manager.concurrently(
+                try_list(path)
+                for _, path in candidates
+            )
+            for (per_cpu, _), listing in zip(candidates, listings):
+                if listing is not None:
+                    tunables: Tuple[str, ...] = tuple(listing)
                     break
             else:
                 per_cpu = False
-                tunables = []
+                tunables = ()
 
-            data: Tuple[str, bool, List[str]] = (cast(str, governor), per_cpu, tunables)
+            data: Tuple[str, bool, Tuple[str, ...]] = (cast(str, governor), per_cpu, tunables)
             if governor:
                 self._governor_tunables[governor] = data
             return data
 
+    def _get_governor_tunables_cache(self) -> Dict[str, Tuple[str, bool, Tuple[str, ...]]]:
+        """
+        Get the governor tunables cache shared with the other instances
+        talking to the same system, or a private one if the system cannot be
+        identified.
+        """
+        try:
+            system_id: Optional[str] = self.target.system_id
+        except (TargetStableError, AttributeError):
+            system_id = None
+        if system_id:
+            return _GOVERNOR_TUNABLES_CACHE.setdefault(system_id, {})
+        else:
+            return {}
+
     @asyn.asyncf
-    async def list_governor_tunables(self, cpu: Union[int, str]) -> Tuple[str, bool, List[str]]:
+    async def list_governor_tunables(self, cpu: Union[int, str]) -> List[str]:
         """
         List the tunables for the specified cpu's current governor.
 
@@ -257,42 +495,87 @@ class CpufreqModule(Module):
             ``1`` or ``"cpu1"``).
         """
         _, _, tunables = await self._list_governor_tunables.asyn(cpu)
-        return tunables
+        return list(tunables)
 
     @asyn.asyncf
-    async def get_governor_tunables(self, cpu: Union[int, str]) -> Dict[str, List[str]]:
+    async def get_governor_tunables(self, cpu: Union[int, str]) -> Dict[str, str]:
         """
         Return a dict with the values of the specified CPU's current governor.
 
         :param cpu: The cpu; could be a numeric or the corresponding string (e.g.
             ``1`` or ``"cpu1"``).
         """
-        if isinstance(cpu, int):
-            cpu = 'cpu{}'.format(cpu)
+        cpu = _cpu_str(cpu)
         governor: str
-        tunable_list: List[str]
-        governor, _, tunable_list = await self._list_governor_tunables.asyn(cpu)
+        gov_per_cpu: bool
+        all_tunables: Tuple[str, ...]
+        governor, gov_per_cpu, all_tunables = await self._list_governor_tunables.asyn(cpu)
 
-        write_only: Set[str] = set(WRITE_ONLY_TUNABLES.get(governor, []))
-        tunable_list = [
+        write_only: FrozenSet[str] = WRITE_ONLY_TUNABLES.get(governor, frozenset())
+        tunable_list: List[str] = [
             tunable
-            for tunable in tunable_list
+            for tunable in all_tunables
             if tunable not in write_only
         ]
 
-        tunables: Dict[str, List[str]] = {}
+        if not tunable_list:
+            return {}
+
+        # Read the location the tunables were listed from first, and only
+        # fall back on the other one for the files that could not be read.
+        tunables: Dict[str, Optional[str]] = {}
+        for per_cpu in (gov_per_cpu, not gov_per_cpu):
+            missing: List[str] = [
+                tunable
+                for tunable in tunable_list
+                if tunables.get(tunable) is None
+            ]
+            if not missing:
+                break
+            paths: Dict[str, str] = {
+                tunable: _p_gov_tunable(cpu, governor, tunable, per_cpu)
+                for tunable in missing
+            }
+            values: Dict[str, Optional[str]] = await self._batch_read_values.asyn(paths.values())
+            for tunable, path in paths.items():
+                tunables[tunable] = values.get(path)
 
-        async def get_tunable(tunable: str) -> str:
-            try:
-                path: str = '/sys/devices/system/cpu/{}/cpufreq/{}/{}'.format(cpu, governor, tunable)
-                x: str = await self.target.read_value.asyn(path)
-            except TargetStableError:  # May be an older kernel
-                path = '/sys/devices/system/cpu/cpufreq/{}/{}'.format(governor, tunable)
-                x = await self.target.read_value.asyn(path)
-            return x
+        unreadable: List[str] = [
+            tunable
+            for tunable, value in tunables.items()
+            if value is None
+        ]
+        if unreadable:
+            raise TargetStableError('Could not read tunables {} of governor {} on {}'.format(
+                unreadable, governor, cpu))
+        return cast(Dict[str, str], tunables)
+
+    @asyn.asyncf
+    async def _batch_read_values(self, paths: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Read several sysfs files using a single command on the target.
 
-        tunables = await self.target.async_manager.map_concurrently(get_tunable, tunable_list)
-        return tunables
+        :returns: A dict mapping each path to its stripped content, or ``None``
+            if the file could not be read.
+        """
+        paths = list(paths)
+        for path in paths:
+            self.target.async_manager.track_access(
+                asyn.PathAccess(namespace='target', path=path, mode='r')
+            )
+        # Each file is reported as \x1e<path>\x1f<value>, or just \x1e<path>
+        # if it could not be read.
+        # pylint: disable=protected-access
+        output: str = await self.target._execute_util.asyn(
+            'cpufreq_read_values {}'.format(' '.join(map(quote, paths))),
+            as_root=self.target.needs_su)
+
+        values: Dict[str, Optional[str]] = dict.fromkeys(paths)
+        for entry in output.split('\x1e')[1:]:
+            path, sep, value = entry.partition('\x1f')
+            if sep:
+                values[path] = value.strip()
+        return values
 
     @asyn.asyncf
     async def set_governor_tunables(self, cpu: Union[int, str], governor: Optional[str] = None,
@@ -319,28 +602,25 @@ class CpufreqModule(Module):
         """
         if not kwargs:
             return
-        if isinstance(cpu, int):
-            cpu = 'cpu{}'.format(cpu)
+        cpu = _cpu_str(cpu)
 
         gov_per_cpu: bool
-        valid_tunables: List[str]
+        valid_tunables: Tuple[str, ...]
         governor, gov_per_cpu, valid_tunables = await self._list_governor_tunables.asyn(cpu, governor=governor)
+        writes: List[Tuple[str, Any]] = []
         for tunable, value in kwargs.items():
             if tunable in valid_tunables:
                 if per_cpu is not None and gov_per_cpu != per_cpu:
                     continue
 
-                if gov_per_cpu:
-                    path: str = '/sys/devices/system/cpu/{}/cpufreq/{}/{}'.format(cpu, governor, tunable)
-                else:
-                    path = '/sys/devices/system/cpu/cpufreq/{}/{}'.format(governor, tunable)
-
-                await self.target.write_value.asyn(path, value)
+                writes.append((_p_gov_tunable(cpu, governor, tunable, gov_per_cpu), value))
             else:
                 message: str = 'Unexpected tunable {} for governor {} on {}.\n'.format(tunable, governor, cpu)
-                message += 'Available tunables are: {}'.format(valid_tunables)
+                message += 'Available tunables are: {}'.format(list(valid_tunables))
                 raise TargetStableError(message)
 
+        await self.target.batch_write_values.asyn(writes)
+
     @asyn.asyncf
     @asyn.memoized_method
     async def list_frequencies(self, cpu: Union[int, str]) -> List[int]:
@@ -350,28 +630,39 @@ class CpufreqModule(Module):
         :param cpu: The cpu; could be a numeric or the corresponding string (e.g.
        ``1`` or ``"cpu1"``).
         """
-        if isinstance(cpu, int):
-            cpu = 'cpu{}'.format(cpu)
+        cpu = _cpu_str(cpu)
+        frequencies: Optional[List[int]] = self._get_static_value('scaling_available_frequencies', cpu)
+        if frequencies is not None:
+            return frequencies
         try:
-            cmd: str = 'cat /sys/devices/system/cpu/{}/cpufreq/scaling_available_frequencies'.format(cpu)
+            cmd: str = 'cat {}'.format(quote(_p_cpufreq(cpu, 'scaling_available_frequencies')))
             output: str = await self.target.execute.asyn(cmd)
             available_frequencies: List[int] = list(map(int, output.strip().split()))  # pylint: disable=E1103
         except TargetStableError:
             # On some devices scaling_frequencies  is not generated.
             # http://adrynalyne-teachtofish.blogspot.co.uk/2011/11/how-to-enable-scalingavailablefrequenci.html
             # Fall back to parsing stats/time_in_state
-            path: str = '/sys/devices/system/cpu/{}/cpufreq/stats/time_in_state'.format(cpu)
+            path: str = _p_cpufreq(cpu, 'stats/time_in_state')
             try:
-                out_iter: List[str] = cast(str, (await self.target.read_value.asyn(path))).split()
+                fields: List[str] = cast(str, (await self.target.read_value.asyn(path))).split()
             except TargetStableError:
                 if not self.target.file_exists(path):
                     # Probably intel_pstate. Can't get available freqs.
                     return []
                 raise
 
-            available_frequencies = list(map(int, reversed([f for f, _ in zip(out_iter, out_iter)])))
+            # time_in_state is made of "<frequency> <time>" lines
+            return sorted(map(int, fields[::2]))
         return sorted(available_frequencies)
 
+    @asyn.asyncf
+    @asyn.memoized_method
+    async def _available_frequencies_set(self, cpu: Union[int, str]) -> FrozenSet[int]:
+        """
+        Same as :meth:`list_frequencies` as a set, for fast membership tests.
+        """
+        return frozenset(await self.list_frequencies.asyn(cpu))
+
     @memoized
     def get_max_available_frequency(self, cpu: Union[str, int]) -> Optional[int]:
         """
@@ -402,9 +693,8 @@ class CpufreqModule(Module):
         :raises: TargetStableError if for some reason the frequency could not be read.
 
         """
-        if isinstance(cpu, int):
-            cpu = 'cpu{}'.format(cpu)
-        sysfile: str = '/sys/devices/system/cpu/{}/cpufreq/scaling_min_freq'.format(cpu)
+        cpu = _cpu_str(cpu)
+        sysfile: str = _p_scaling_min(cpu)
         return await self.target.read_int.asyn(sysfile)
 
     @asyn.asyncf
@@ -425,16 +715,15 @@ class CpufreqModule(Module):
         :raises: ValueError if ``frequency`` is not an integer.
 
         """
-        if isinstance(cpu, int):
-            cpu = 'cpu{}'.format(cpu)
+        cpu = _cpu_str(cpu)
         available_frequencies: List[int] = await self.list_frequencies.asyn(cpu)
         try:
             value = int(frequency)
-            if exact and available_frequencies and value not in available_frequencies:
+            if exact and available_frequencies and value not in await self._available_frequencies_set.asyn(cpu):
                 raise TargetStableError('Can\'t set {} frequency to {}\nmust be in {}'.format(cpu,
                                                                                               value,
                                                                                               available_frequencies))
-            sysfile: str = '/sys/devices/system/cpu/{}/cpufreq/scaling_min_freq'.format(cpu)
+            sysfile: str = _p_scaling_min(cpu)
             await self.target.write_value.asyn(sysfile, value)
         except ValueError:
             raise ValueError('Frequency must be an integer; got: "{}"'.format(frequency))
@@ -454,14 +743,40 @@ class CpufreqModule(Module):
         :raises: TargetStableError if for some reason the frequency could not be read.
 
         """
-        if isinstance(cpu, int):
-            cpu = 'cpu{}'.format(cpu)
+        cpu = _cpu_str(cpu)
 
-        sysfile: str = '/sys/devices/system/cpu/{}/cpufreq/{}'.format(
-            cpu,
-            'cpuinfo_cur_freq' if cpuinfo else 'scaling_cur_freq')
+        sysfile: str = _p_cpufreq(cpu, 'cpuinfo_cur_freq') if cpuinfo else _p_scaling_cur(cpu)
         return await self.target.read_int.asyn(sysfile)
 
+    @asyn.asyncf
+    async def get_frequencies(self, cpus: List[Union[str, int]],
+                              kind: str = 'scaling_cur_freq') -> Dict[Union[str, int], int]:
+        """
+        Same as :meth:`get_frequency` for several CPUs, using a single command
+        on the target.
+
+        :param cpus: The list of CPUs to read the frequency of.
+        :param kind: Name of the cpufreq sysfs file to read, e.g.
+            ``scaling_cur_freq``, ``cpuinfo_cur_freq``, ``scaling_min_freq``
+            or ``scaling_max_freq``.
+
+        :returns: A dict mapping each of ``cpus`` to its frequency.
+        :raises: TargetStableError if for some reason a frequency could not be read.
+        """
+        paths: Dict[Union[str, int], str] = {
+            cpu: _p_cpufreq(_cpu_str(cpu), kind)
+            for cpu in cpus
+        }
+        values: Dict[str, Optional[str]] = await self._batch_read_values.asyn(paths.values())
+
+        frequencies: Dict[Union[str, int], int] = {}
+        for cpu, path in paths.items():
+            value: Optional[str] = values[path]
+            if value is None:
+                raise TargetStableError('Could not read {}'.format(path))
+            frequencies[cpu] = int(value)
+        return frequencies
+
     @asyn.asyncf
     async def set_frequency(self, cpu: Union[str, int], frequency: Union[int, str], exact: bool = True) -> None:
         """
@@ -484,19 +799,18 @@ class CpufreqModule(Module):
         :raises: ValueError if ``frequency`` is not an integer.
 
         """
-        if isinstance(cpu, int):
-            cpu = 'cpu{}'.format(cpu)
+        cpu = _cpu_str(cpu)
         try:
             value = int(frequency)
             if exact:
                 available_frequencies: List[int] = await self.list_frequencies.asyn(cpu)
-                if available_frequencies and value not in available_frequencies:
+                if available_frequencies and value not in await self._available_frequencies_set.asyn(cpu):
                     raise TargetStableError('Can\'t set {} frequency to {}\nmust be in {}'.format(cpu,
                                                                                                   value,
                                                                                                   available_frequencies))
             if await self.get_governor.asyn(cpu) != 'userspace':
                 raise TargetStableError('Can\'t set {} frequency; governor must be "userspace"'.format(cpu))
-            sysfile: str = '/sys/devices/system/cpu/{}/cpufreq/scaling_setspeed'.format(cpu)
+            sysfile: str = _p_scaling_setspeed(cpu)
             await self.target.write_value.asyn(sysfile, value, verify=False)
             cpuinfo: int = await self.get_frequency.asyn(cpu, cpuinfo=True)
             if cpuinfo != value:
@@ -516,9 +830,8 @@ class CpufreqModule(Module):
 
         :raises: TargetStableError if for some reason the frequency could not be read.
         """
-        if isinstance(cpu, int):
-            cpu = 'cpu{}'.format(cpu)
-        sysfile: str = '/sys/devices/system/cpu/{}/cpufreq/scaling_max_freq'.format(cpu)
+        cpu = _cpu_str(cpu)
+        sysfile: str = _p_scaling_max(cpu)
         return await self.target.read_int.asyn(sysfile)
 
     @asyn.asyncf
@@ -540,16 +853,15 @@ class CpufreqModule(Module):
         :raises: ValueError if ``frequency`` is not an integer.
 
         """
-        if isinstance(cpu, int):
-            cpu = 'cpu{}'.format(cpu)
+        cpu = _cpu_str(cpu)
         available_frequencies = await self.list_frequencies.asyn(cpu)
         try:
             value = int(frequency)
-            if exact and available_frequencies and value not in available_frequencies:
+            if exact and available_frequencies and value not in await self._available_frequencies_set.asyn(cpu):
                 raise TargetStableError('Can\'t set {} frequency to {}\nmust be in {}'.format(cpu,
                                                                                               value,
                                                                                               available_frequencies))
-            sysfile: str = '/sys/devices/system/cpu/{}/cpufreq/scaling_max_freq'.format(cpu)
+            sysfile: str = _p_scaling_max(cpu)
             await self.target.write_value.asyn(sysfile, value)
         except ValueError:
             raise ValueError('Frequency must be an integer; got: "{}"'.format(frequency))
@@ -562,9 +874,24 @@ class CpufreqModule(Module):
 
         :param cpus: The list of CPU for which the governor is to be set.
         """
+        cpus = _unique_cpus(cpus)
+        if not cpus:
+            return
+        supported: Dict[Union[str, int], List[str]] = await self.target.async_manager.map_concurrently(
+            self.list_governors.asyn,
+            cpus,
+        )
+        for cpu in cpus:
+            if governor not in supported[cpu]:
+                raise TargetStableError('Governor {} not supported for cpu {}'.format(governor, _cpu_str(cpu)))
+
+        await self.target.batch_write_values.asyn(
+            (_p_scaling_gov(_cpu_str(cpu)), governor)
+            for cpu in cpus
+        )
         await self.target.async_manager.concurrently(
-            self.set_governor(cpu, governor, **kwargs)
-            for cpu in sorted(set(cpus))
+            self.set_governor_tunables.asyn(cpu, governor, **kwargs)
+            for cpu in cpus
         )
 
     @asyn.asyncf
@@ -575,10 +902,42 @@ class CpufreqModule(Module):
 
         :param cpus: The list of CPU for which the frequency has to be set.
         """
-        await self.target.async_manager.concurrently(
-            self.set_frequency(cpu, freq, exact)
-            for cpu in sorted(set(cpus))
+        cpus = _unique_cpus(cpus)
+        if not cpus:
+            return
+        try:
+            value = int(freq)
+        except ValueError:
+            raise ValueError('Frequency must be an integer; got: "{}"'.format(freq))
+
+        if exact:
+            available: Dict[Union[str, int], List[int]] = await self.target.async_manager.map_concurrently(
+                self.list_frequencies.asyn,
+                cpus,
+            )
+            for cpu in cpus:
+                if available[cpu] and value not in await self._available_frequencies_set.asyn(cpu):
+                    raise TargetStableError('Can\'t set {} frequency to {}\nmust be in {}'.format(
+                        _cpu_str(cpu), value, available[cpu]))
+
+        governors: Dict[str, Optional[str]] = await self._batch_read_values.asyn(
+            _p_scaling_gov(_cpu_str(cpu))
+            for cpu in cpus
+        )
+        for cpu in cpus:
+            if governors[_p_scaling_gov(_cpu_str(cpu))] != 'userspace':
+                raise TargetStableError('Can\'t set {} frequency; governor must be "userspace"'.format(_cpu_str(cpu)))
+
+        await self.target.batch_write_values.asyn(
+            ((_p_scaling_setspeed(_cpu_str(cpu)), value)
+             for cpu in cpus),
+            verify=False,
         )
+        cpuinfo: Dict[Union[str, int], int] = await self.get_frequencies.asyn(cpus, kind='cpuinfo_cur_freq')
+        for cpu in cpus:
+            if cpuinfo[cpu] != value:
+                self.logger.warning(
+                    'The cpufreq value has not been applied properly cpuinfo={} request={}'.format(cpuinfo[cpu], value))
 
     @asyn.asyncf
     async def set_all_frequencies(self, freq: int) -> None:
@@ -599,11 +958,11 @@ class CpufreqModule(Module):
         output: str = await self.target._execute_util.asyn(
             'cpufreq_get_all_frequencies', as_root=True)
         frequencies: Dict[str, str] = {}
-        for x in output.splitlines():
-            kv = x.split(' ')
-            if kv[0] == '':
+        for line in output.splitlines():
+            cpu, _, value = line.partition(' ')
+            if not cpu:
                 break
-            frequencies[kv[0]] = kv[1]
+            frequencies[cpu] = value
         return frequencies
 
     @asyn.asyncf
@@ -620,8 +979,13 @@ class CpufreqModule(Module):
             if ("echo: I/O error" in str(e) or
                "write error: Invalid argument" in str(e)):
 
-                cpus_unsupported: List[int] = [c for c in await self.target.list_online_cpus.asyn()
-                                               if governor not in await self.list_governors.asyn(c)]
+                online_cpus: List[int] = await self.target.list_online_cpus.asyn()
+                supported: Dict[int, List[str]] = await self.target.async_manager.map_concurrently(
+                    self.list_governors.asyn,
+                    online_cpus,
+                )
+                cpus_unsupported: List[int] = [c for c in online_cpus
+                                               if governor not in supported[c]]
                 raise TargetStableError("Governor {} unsupported for CPUs {}".format(
                     governor, cpus_unsupported))
             else:
@@ -636,11 +1000,11 @@ class CpufreqModule(Module):
         output = await self.target._execute_util.asyn(
             'cpufreq_get_all_governors', as_root=True)
         governors = {}
-        for x in output.splitlines():
-            kv = x.split(' ')
-            if kv[0] == '':
+        for line in output.splitlines():
+            cpu, _, value = line.partition(' ')
+            if not cpu:
                 break
-            governors[kv[0]] = kv[1]
+            governors[cpu] = value
         return governors
 
     @asyn.asyncf
@@ -655,14 +1019,32 @@ class CpufreqModule(Module):
     async def get_affected_cpus(self, cpu: Union[str, int]) -> List[int]:
         """
         Get the online CPUs that share a frequency domain with the given CPU
+
+        .. note:: The result is cached until :meth:`invalidate_affected_cpus`
+            is called, which the ``hotplug`` module does whenever it changes
+            the set of online CPUs.
         """
-        if isinstance(cpu, int):
-            cpu = 'cpu{}'.format(cpu)
+        cpu = _cpu_str(cpu)
+        try:
+            return self._affected_cpus[cpu]
+        except KeyError:
+            pass
 
-        sysfile = '/sys/devices/system/cpu/{}/cpufreq/affected_cpus'.format(cpu)
+        sysfile = _p_affected(cpu)
 
         content = await self.target.read_value.asyn(sysfile)
-        return [int(c) for c in content.split()]
+        return self._affected_cpus.setdefault(cpu, [int(c) for c in content.split()])
+
+    def invalidate_affected_cpus(self, cpu: Optional[Union[str, int]] = None) -> None:
+        """
+        Drop the cached result of :meth:`get_affected_cpus` for the given CPU,
+        or for all CPUs if ``cpu`` is ``None``. This needs to be called after
+        CPUs are hotplugged behind the back of the ``hotplug`` module.
+        """
+        if cpu is None:
+            self._affected_cpus.clear()
+        else:
+            self._affected_cpus.pop(_cpu_str(cpu), None)
 
     @asyn.asyncf
     @asyn.memoized_method
@@ -670,10 +1052,12 @@ class CpufreqModule(Module):
         """
         Get the CPUs that share a frequency domain with the given CPU
         """
-        if isinstance(cpu, int):
-            cpu = 'cpu{}'.format(cpu)
+        cpu = _cpu_str(cpu)
+        related: Optional[List[int]] = self._get_static_value('related_cpus', cpu)
+        if related is not None:
+            return related
 
-        sysfile = '/sys/devices/system/cpu/{}/cpufreq/related_cpus'.format(cpu)
+        sysfile = _p_related(cpu)
 
         return [int(c) for c in cast(str, (await self.target.read_value.asyn(sysfile))).split()]
 
@@ -683,21 +1067,30 @@ class CpufreqModule(Module):
         """
         Get the name of the driver used by this cpufreq policy.
         """
-        if isinstance(cpu, int):
-            cpu = 'cpu{}'.format(cpu)
+        cpu = _cpu_str(cpu)
+        driver: Optional[str] = self._get_static_value('scaling_driver', cpu)
+        if driver is not None:
+            return driver
 
-        sysfile = '/sys/devices/system/cpu/{}/cpufreq/scaling_driver'.format(cpu)
+        sysfile = _p_driver(cpu)
 
         return cast(str, (await self.target.read_value.asyn(sysfile))).strip()
 
     @asyn.asyncf
-    async def iter_domains(self) -> AsyncGenerator[Set[int], None]:
+    async def iter_domains(self) -> AsyncGenerator[List[int], None]:
         """
-        Iterate over the frequency domains in the system
+        Iterate over the frequency domains in the system, as lists of CPUs
         """
+        # The domains are known straight away when the kernel has policy
+        # directories.
+        if self._policies_cpus is not None:
+            for policy_cpus in self._policies_cpus:
+                yield list(policy_cpus)
+            return
+
         cpus = set(range(self.target.number_of_cpus))
         while cpus:
             cpu = next(iter(cpus))  # pylint: disable=stop-iteration-return
-            domain: Set[int] = await cast(CpufreqModule, self.target.cpufreq).get_related_cpus.asyn(cpu)
+            domain: List[int] = await cast(CpufreqModule, self.target.cpufreq).get_related_cpus.asyn(cpu)
             yield domain
-            cpus = cpus.difference(domain)
+            cpus.difference_update(domain)
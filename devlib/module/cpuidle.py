@@ -14,21 +14,37 @@
 #
 # pylint: disable=attribute-defined-outside-init
 
+import re
+import sys
+from glob import glob, escape as glob_escape
 from operator import attrgetter
 from pprint import pformat
+from shlex import quote
+from time import monotonic
+from weakref import WeakKeyDictionary
 
+from devlib.host import LocalConnection
 from devlib.module import Module
 from devlib.exception import TargetStableError
 from devlib.utils.types import integer, boolean
-from devlib.utils.misc import memoized
 import devlib.utils.asyn as asyn
-from typing import Optional, TYPE_CHECKING, Union, List
+from typing import Optional, TYPE_CHECKING, Union, List, Dict, Tuple, FrozenSet
 if TYPE_CHECKING:
     from devlib.target import Target
 
 
+_ORDINAL_RE = re.compile(r'.*?(\d+)$')
+
+# Available idle governors of each target, both in the order listed by the
+# kernel and as a set for membership tests. They cannot change until reboot.
+_GOVERNOR_CACHE: 'WeakKeyDictionary[Target, Tuple[Tuple[str, ...], FrozenSet[str]]]' = WeakKeyDictionary()
+
+
 class CpuidleState(object):
 
+    __slots__ = ('target', 'index', 'path', 'name', 'desc', 'power', 'latency', 'residency',
+                 'id', 'cpu', 'ordinal', 'cache_ttl', '_prop_cache', '_keys')
+
     @property
     def usage(self) -> int:
         return integer(self.get('usage'))
@@ -41,27 +57,34 @@ class CpuidleState(object):
     def is_enabled(self) -> bool:
         return not boolean(self.get('disable'))
 
-    @property
-    def ordinal(self) -> int:
-        i = len(self.id)
-        while self.id[i - 1].isdigit():
-            i -= 1
-            if not i:
-                raise ValueError('invalid idle state name: "{}"'.format(self.id))
-        return int(self.id[i:])
-
     def __init__(self, target: 'Target', index: int, path: str, name: str,
                  desc: str, power: int, latency: int, residency: Optional[int]):
         self.target = target
         self.index = index
         self.path = path
-        self.name = name
-        self.desc = desc
+        # Interned so that comparisons in lookups can succeed on identity
+        self.name = sys.intern(name)
+        self.desc = sys.intern(desc)
         self.power = power
         self.latency = latency
         self.residency = residency
-        self.id: str = self.target.path.basename(self.path)
-        self.cpu: str = self.target.path.basename(self.target.path.dirname(path))
+        # path is formatted as .../cpuN/cpuidle/stateM
+        parts = path.rsplit('/', 3)
+        self.id: str = sys.intern(parts[-1])
+        self.cpu: str = sys.intern(parts[-3])
+        match = _ORDINAL_RE.match(self.id)
+        if match is None:
+            raise ValueError('invalid idle state name: "{}"'.format(self.id))
+        self.ordinal: int = int(match.group(1))
+        # Strings this state can be looked up by
+        self._keys: FrozenSet[str] = frozenset((self.id, self.name, self.desc))
+        self.cache_ttl: float = 0
+        """
+        Time in seconds during which :meth:`get` will return the last value it
+        read for a property rather than reading it again. ``0`` disables caching.
+        """
+        # Property name -> (timestamp, value) of the last read
+        self._prop_cache: Dict[str, Tuple[float, str]] = {}
 
     @asyn.asyncf
     async def enable(self) -> None:
@@ -82,8 +105,21 @@ class CpuidleState(object):
         """
         get the property
         """
+        now = monotonic()
+        if self.cache_ttl:
+            try:
+                timestamp, value = self._prop_cache[prop]
+            except KeyError:
+                pass
+            else:
+                if now - timestamp < self.cache_ttl:
+                    return value
+
         property_path = self.target.path.join(self.path, prop)
-        return await self.target.read_value.asyn(property_path)
+        value = await self.target.read_value.asyn(property_path)
+        if self.cache_ttl:
+            self._prop_cache[prop] = (now, value)
+        return value
 
     @asyn.asyncf
     async def set(self, prop: str, value: str) -> None:
@@ -91,8 +127,19 @@ class CpuidleState(object):
         set the property
         """
         property_path = self.target.path.join(self.path, prop)
+        self._prop_cache.pop(prop, None)
         await self.target.write_value.asyn(property_path, value)
 
+    def invalidate(self, prop: Optional[str] = None) -> None:
+        """
+        Drop the cached value of a property read by :meth:`get`, or of all of
+        them if ``prop`` is ``None``.
+        """
+        if prop is None:
+            self._prop_cache.clear()
+        else:
+            self._prop_cache.pop(prop, None)
+
     def __eq__(self, other):
         if isinstance(other, CpuidleState):
             return (self.name == other.name) and (self.desc == other.desc)
@@ -124,45 +171,133 @@ class Cpuidle(Module):
 
     def __init__(self, target: 'Target'):
         super(Cpuidle, self).__init__(target)
+        self._cpu_names: Tuple[str, ...] = tuple('cpu{}'.format(i) for i in range(target.number_of_cpus))
+
+        # The states of each CPU are only read the first time they are needed
+        self._states: Dict[str, List[CpuidleState]] = {}
+        # Allow looking states up by any of their id, name or description.
+        # The first state matching a given key wins, as it would with a
+        # linear scan of the sorted states.
+        self._state_index: Dict[str, Dict[str, CpuidleState]] = {}
+
+    def _load_states(self, cpu_name: str) -> List[CpuidleState]:
+        try:
+            return self._states[cpu_name]
+        except KeyError:
+            pass
 
         basepath: str = '/sys/devices/system/cpu/'
-        # FIXME - annotating the values_tree based on read_tree_values return type is causing errors due to recursive
-        # definition of the Node type. leaving it out for now
-        values_tree = self.target.read_tree_values(basepath, depth=4, check_exit_code=False)
-
-        self._states = {
-            cpu_name: sorted(
-                (
-                    CpuidleState(
-                        self.target,
-                        # state_name is formatted as "state42"
-                        index=int(state_name[len('state'):]),
-                        path=self.target.path.join(basepath, cpu_name, 'cpuidle', state_name),
-                        name=state_node['name'],
-                        desc=state_node['desc'],
-                        power=int(state_node['power']),
-                        latency=int(state_node['latency']),
-                        residency=int(state_node['residency']) if 'residency' in state_node else None,
-                    )
-                    for state_name, state_node in cpu_node['cpuidle'].items()
-                    if state_name.startswith('state')
-                ),
-                key=attrgetter('index'),
+        try:
+            cpu_states: Dict[str, Dict[str, str]] = self._read_states_values(cpu_name).get(cpu_name, {})
+        except TargetStableError:
+            # FIXME - annotating the values_tree based on read_tree_values return type is causing errors due to
+            # recursive definition of the Node type. leaving it out for now
+            values_tree = self.target.read_tree_values(self.target.path.join(basepath, cpu_name, 'cpuidle'),
+                                                       depth=2, check_exit_code=False)
+            cpu_states = {
+                state_name: state_node
+                for state_name, state_node in values_tree.items()
+                if state_name.startswith('state')
+            }
+
+        states = [
+            CpuidleState(
+                self.target,
+                # state_name is formatted as "state42"
+                index=int(state_name[len('state'):]),
+                path=self.target.path.join(basepath, cpu_name, 'cpuidle', state_name),
+                name=state_node['name'],
+                desc=state_node['desc'],
+                power=int(state_node['power']),
+                latency=int(state_node['latency']),
+                residency=int(state_node['residency']) if 'residency' in state_node else None,
             )
+            for state_name, state_node in cpu_states.items()
+        ]
+        # The states are usually listed in order already, but not always
+        # (e.g. "state10" sorts before "state2" in a shell glob).
+        if any(prev.index > state.index for prev, state in zip(states, states[1:])):
+            states.sort(key=attrgetter('index'))
+
+        index: Dict[str, CpuidleState] = {}
+        for state in states:
+            for key in state._keys:  # pylint: disable=protected-access
+                index.setdefault(key, state)
+
+        self.logger.debug('Adding cpuidle states of {}:\n{}'.format(cpu_name, pformat(states)))
+        self._states[cpu_name] = states
+        self._state_index[cpu_name] = index
+        return states
+
+    def _read_states_values(self, cpu_name: str) -> Dict[str, Dict[str, Dict[str, str]]]:
+        """
+        Read the attributes of all the idle states of a CPU with a single
+        command, rather than walking its sysfs tree.
 
-            for cpu_name, cpu_node in values_tree.items()
-            if cpu_name.startswith('cpu') and 'cpuidle' in cpu_node
-        }
+        :param cpu_name: Name of the CPU, e.g. ``"cpu0"``.
+        :returns: A dict mapping CPU names to a dict mapping state names to
+            their attributes.
+        :raises TargetStableError: If the values could not be read.
+        """
+        if isinstance(self.target.conn, LocalConnection):
+            return self._read_local_states_values('/sys/devices/system/cpu/', cpu_name)
 
-        self.logger.debug('Adding cpuidle states:\n{}'.format(pformat(self._states)))
+        # pylint: disable=protected-access
+        output: Optional[str] = self.target._execute_util('cpuidle_read_states {}'.format(quote(cpu_name)),
+                                                          as_root=self.target.is_rooted,
+                                                          check_exit_code=False)
+        if output is None:
+            raise TargetStableError('Could not read cpuidle states')
+
+        values: Dict[str, Dict[str, Dict[str, str]]] = {}
+        for line in output.splitlines():
+            # Lines are formatted as <path>:<value>, with paths such as
+            # /sys/devices/system/cpu/cpu0/cpuidle/state1/name
+            path, sep, value = line.partition(':')
+            if not sep:
+                continue
+            parts = path.split('/')
+            if len(parts) < 4 or parts[-3] != 'cpuidle':
+                continue
+            cpu_name, _, state_name, attr = parts[-4:]
+            state_values = values.setdefault(cpu_name, {}).setdefault(state_name, {})
+            # Multi-line files appear as several lines for the same path
+            if attr in state_values:
+                state_values[attr] += '\n' + value
+            else:
+                state_values[attr] = value
+        return values
+
+    @staticmethod
+    def _read_local_states_values(basepath: str, cpu_name: str) -> Dict[str, Dict[str, Dict[str, str]]]:
+        """
+        Same as :meth:`_read_states_values` for the local host, reading the
+        files directly instead of spawning a shell.
+        """
+        values: Dict[str, Dict[str, Dict[str, str]]] = {}
+        for path in glob(basepath + glob_escape(cpu_name) + '/cpuidle/state[0-9]*/*'):
+            try:
+                with open(path) as f:
+                    value = f.read()
+            # Sub-directories and unreadable files are skipped, as grep -s does
+            except OSError:
+                continue
+            cpu_name, _, state_name, attr = path.split('/')[-4:]
+            values.setdefault(cpu_name, {}).setdefault(state_name, {})[attr] = value.strip()
+        return values
+
+    def _cpu_name(self, cpu: Union[int, str]) -> str:
+        if isinstance(cpu, int):
+            if 0 <= cpu < len(self._cpu_names):
+                return self._cpu_names[cpu]
+            return 'cpu{}'.format(cpu)
+        return cpu
 
     def get_states(self, cpu: Union[int, str] = 0) -> List[CpuidleState]:
         """
         get the cpu idle states
         """
-        if isinstance(cpu, int):
-            cpu = 'cpu{}'.format(cpu)
-        return self._states.get(cpu, [])
+        return self._load_states(self._cpu_name(cpu))
 
     def get_state(self, state: Union[str, int], cpu: Union[str, int] = 0) -> CpuidleState:
         """
@@ -174,10 +309,12 @@ class Cpuidle(Module):
             except IndexError:
                 raise ValueError('Cpuidle state {} does not exist'.format(state))
         else:  # assume string-like
-            for s in self.get_states(cpu):
-                if state in [s.id, s.name, s.desc]:
-                    return s
-            raise ValueError('Cpuidle state {} does not exist'.format(state))
+            cpu_name = self._cpu_name(cpu)
+            self._load_states(cpu_name)
+            try:
+                return self._state_index[cpu_name][state]
+            except KeyError:
+                raise ValueError('Cpuidle state {} does not exist'.format(state))
 
     @asyn.asyncf
     async def enable(self, state: Union[str, int], cpu: Union[str, int] = 0) -> None:
@@ -198,20 +335,30 @@ class Cpuidle(Module):
         """
         enable all the cpu idle states
         """
-        await self.target.async_manager.concurrently(
-            state.enable.asyn()
-            for state in self.get_states(cpu)
-        )
+        await self._set_all_disable(cpu, 0)
 
     @asyn.asyncf
     async def disable_all(self, cpu: Union[str, int] = 0) -> None:
         """
         disable all cpu idle states
         """
-        await self.target.async_manager.concurrently(
-            state.disable.asyn()
-            for state in self.get_states(cpu)
-        )
+        await self._set_all_disable(cpu, 1)
+
+    async def _set_all_disable(self, cpu: Union[str, int], value: int) -> None:
+        states = self.get_states(cpu)
+        for state in states:
+            state.invalidate('disable')
+        try:
+            # Write all the states with a single command rather than one per state
+            await self.target.batch_write_values.asyn(
+                (self.target.path.join(state.path, 'disable'), value)
+                for state in states
+            )
+        except TargetStableError:
+            await self.target.async_manager.concurrently(
+                state.set.asyn('disable', value)
+                for state in states
+            )
 
     @asyn.asyncf
     async def perturb_cpus(self) -> None:
@@ -228,12 +375,18 @@ class Cpuidle(Module):
         """
         return await self.target.read_value.asyn(self.target.path.join(self.root_path, 'current_driver'))
 
-    @memoized
+    def _get_governors(self) -> Tuple[Tuple[str, ...], FrozenSet[str]]:
+        try:
+            return _GOVERNOR_CACHE[self.target]
+        except KeyError:
+            sysfile: str = self.target.path.join(self.root_path, 'available_governors')
+            governors = tuple(self.target.read_value(sysfile).split())
+            return _GOVERNOR_CACHE.setdefault(self.target, (governors, frozenset(governors)))
+
     def list_governors(self) -> List[str]:
         """Returns a list of supported idle governors."""
-        sysfile: str = self.target.path.join(self.root_path, 'available_governors')
-        output: str = self.target.read_value(sysfile)
-        return output.strip().split()
+        governors, _ = self._get_governors()
+        return list(governors)
 
     @asyn.asyncf
     async def get_governor(self) -> str:
@@ -253,7 +406,7 @@ class Cpuidle(Module):
         :raises TargetStableError if governor is not supported by the CPU, or
         if, for some reason, the governor could not be set.
         """
-        supported: List[str] = self.list_governors()
+        _, supported = self._get_governors()
         if governor not in supported:
             raise TargetStableError('Governor {} not supported'.format(governor))
         sysfile: str = self.target.path.join(self.root_path, 'current_governor')
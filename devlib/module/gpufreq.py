@@ -28,14 +28,24 @@
 # limitations under the License.
 
 import re
+import time
+from weakref import WeakKeyDictionary
+
 from devlib.module import Module
 from devlib.exception import TargetStableError
 from devlib.utils.misc import memoized
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, FrozenSet, List, Optional, Tuple
 if TYPE_CHECKING:
     from devlib.target import Target
 
 
+_ADRENO_RE = re.compile('adreno', re.IGNORECASE)
+
+# Outcome of probe() and GPU model read while probing, for each target
+_PROBE_CACHE: 'WeakKeyDictionary[Target, bool]' = WeakKeyDictionary()
+_MODEL_CACHE: 'WeakKeyDictionary[Target, str]' = WeakKeyDictionary()
+
+
 class GpufreqModule(Module):
     """
     module that handles gpu frequency scaling
@@ -43,30 +53,47 @@ class GpufreqModule(Module):
     name = 'gpufreq'
     path = ''
 
+    cache_ttl: float = 0
+    """
+    Time in seconds during which :meth:`get_current_frequency` will return the
+    last value it read rather than reading it again. ``0`` disables caching.
+    """
+
     def __init__(self, target: 'Target'):
         super(GpufreqModule, self).__init__(target)
         frequencies_str: str = self.target.read_value("/sys/kernel/gpu/gpu_freq_table")
-        self.frequencies: List[int] = list(map(int, frequencies_str.split(" ")))
-        self.frequencies.sort()
+        self.frequencies: List[int] = sorted(map(int, frequencies_str.split()))
         self.governors: List[str] = self.target.read_value("/sys/kernel/gpu/gpu_available_governor").split(" ")
+        self._governors_set: FrozenSet[str] = frozenset(self.governors)
+        # (timestamp, frequency) of the last read of the current frequency
+        self._freq_cache: Tuple[float, Optional[int]] = (0.0, None)
 
     @staticmethod
     def probe(target: 'Target') -> bool:
+        try:
+            return _PROBE_CACHE[target]
+        except KeyError:
+            pass
+
         # kgsl/Adreno
         probe_path: str = '/sys/kernel/gpu/'
+        supported = False
         if target.file_exists(probe_path):
             model: str = target.read_value(probe_path + "gpu_model")
-            if re.search('adreno', model, re.IGNORECASE):
-                return True
-        return False
+            _MODEL_CACHE[target] = model
+            supported = _ADRENO_RE.search(model) is not None
+        _PROBE_CACHE[target] = supported
+        return supported
 
     def set_governor(self, governor: str) -> None:
         """
         set the governor to the gpu
         """
-        if governor not in self.governors:
+        if governor not in self._governors_set:
             raise TargetStableError('Governor {} not supported for gpu'.format(governor))
         self.target.write_value("/sys/kernel/gpu/gpu_governor", governor)
+        # The frequency is likely to change with the governor
+        self._freq_cache = (0.0, None)
 
     def get_frequencies(self) -> List[int]:
         """
@@ -74,7 +101,7 @@ class GpufreqModule(Module):
         """
         return self.frequencies
 
-    def get_current_frequency(self) -> int:
+    def get_current_frequency(self, force: bool = False) -> int:
         """
         Returns the current frequency currently set for the GPU.
 
@@ -82,16 +109,34 @@ class GpufreqModule(Module):
         try to read the current frequency and the following exception will be
         raised ::
 
+        On some platforms, reading the current clock is expensive on the
+        kernel side. When polling it, set :attr:`cache_ttl` to bound the rate
+        at which it is actually read.
+
+        :param force: If ``True``, read the frequency from the target even if
+            a value less than :attr:`cache_ttl` seconds old is available.
+
         :raises: TargetStableError if for some reason the frequency could not be read.
 
         """
-        return int(self.target.read_value("/sys/kernel/gpu/gpu_clock"))
+        timestamp, frequency = self._freq_cache
+        now = time.monotonic()
+        if not force and frequency is not None and now - timestamp < self.cache_ttl:
+            return frequency
+
+        frequency = int(self.target.read_value("/sys/kernel/gpu/gpu_clock"))
+        self._freq_cache = (now, frequency)
+        return frequency
 
     @memoized
     def get_model_name(self) -> str:
         """
         Returns the model name reported by the GPU.
         """
+        try:
+            return _MODEL_CACHE[self.target]
+        except KeyError:
+            pass
         try:
             return self.target.read_value("/sys/kernel/gpu/gpu_model")
         except:  # pylint: disable=bare-except
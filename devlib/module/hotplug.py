@@ -17,6 +17,7 @@ from devlib.module import Module
 from devlib.exception import TargetTransientError
 from typing import TYPE_CHECKING, Dict, cast, Union, List
 if TYPE_CHECKING:
+    from devlib.module.cpufreq import CpufreqModule
     from devlib.target import Target
 
 
@@ -57,8 +58,11 @@ class HotplugModule(Module):
         """
         bring all cpus online
         """
-        self.target._execute_util('hotplug_online_all',  # pylint: disable=protected-access
-                                  as_root=self.target.is_rooted)
+        try:
+            self.target._execute_util('hotplug_online_all',  # pylint: disable=protected-access
+                                      as_root=self.target.is_rooted)
+        finally:
+            self._invalidate_cpufreq()
         if verify:
             offline = set(self.target.list_offline_cpus())
             if offline:
@@ -86,7 +90,20 @@ class HotplugModule(Module):
         if not self.target.file_exists(path):
             return
         value = 1 if online else 0
-        self.target.write_value(path, value)
+        try:
+            self.target.write_value(path, value)
+        finally:
+            self._invalidate_cpufreq()
+
+    def _invalidate_cpufreq(self) -> None:
+        """
+        Hotplugging a CPU changes the online CPUs of its cpufreq policy, so
+        drop what the cpufreq module cached about them.
+        """
+        # Only look at installed modules, to avoid loading cpufreq here
+        cpufreq = self.target.get_installed_module('cpufreq')
+        if cpufreq is not None:
+            cast('CpufreqModule', cpufreq).invalidate_affected_cpus()
 
     def _get_path(self, path: str) -> str:
         """
@@ -13,8 +13,13 @@
 # limitations under the License.
 #
 
+import functools
 import logging
+import posixpath
 import re
+from collections.abc import Mapping
+from shlex import quote
+from types import MappingProxyType
 
 from devlib.module import Module
 from devlib.utils.misc import memoized, get_logger
@@ -22,11 +27,29 @@ from devlib.utils.types import boolean
 from devlib.exception import TargetStableError
 from typing import (TYPE_CHECKING, cast, Match, Dict,
                     Any, List, Union, Optional,
-                    Tuple, Set)
+                    Tuple, Set, FrozenSet, Iterator)
 if TYPE_CHECKING:
     from devlib.target import Target
 
 
+# "<attribute>:<value>" lines output by sched_get_kernel_attributes
+_KV_RE = re.compile(r'^[ \t]*([^:\n]+?)[ \t]*:[ \t]*(\S+)[ \t\r]*$', re.MULTILINE)
+
+# "<path>:<capacity>" lines output by sched_get_cpu_capacities
+_CAPACITY_RE = re.compile(r'.*/cpu(\d+)/cpu_capacity:(\d+)$')
+
+# Entries of the sched features file, disabled ones being prefixed by "NO_"
+_FEATURE_RE = re.compile(r'(NO_)?(\S+)')
+
+
+@functools.lru_cache(maxsize=None)
+def _cpu_dmips_capacity_path(path_module: Any, cpu_sysfs_root: str, cpu: int) -> str:
+    if path_module is posixpath:
+        return '{}/cpu{}/cpu_capacity'.format(cpu_sysfs_root.rstrip('/'), cpu)
+    else:
+        return path_module.join(cpu_sysfs_root, 'cpu{}/cpu_capacity'.format(cpu))
+
+
 class SchedProcFSNode(object):
     """
     Represents a sched_domain procfs node
@@ -52,49 +75,63 @@ class SchedProcFSNode(object):
     MC
     """
 
-    _re_procfs_node = re.compile(r"(?P<name>.*\D)(?P<digits>\d+)$")
+    # Always used with match(), so that the pattern is anchored at both ends.
+    # A greedy "name" group is faster than a non-greedy one on the short node
+    # names found in procfs.
+    _re_procfs_node = re.compile(r"(?P<name>.*\D)(?P<digits>\d+)\Z")
 
     PACKABLE_ENTRIES: List[str] = [
         "cpu",
         "domain",
         "group"
     ]
+    _PACKABLE_SET: FrozenSet[str] = frozenset(PACKABLE_ENTRIES)
 
     @staticmethod
-    def _ends_with_digits(node: str) -> bool:
+    def _ends_with_digits(node: str, match: Optional[Match] = None) -> bool:
         """
         returns True if the node ends with digits
+
+        :param match: Result of matching ``_re_procfs_node`` against the node,
+            if already available.
         """
         if not isinstance(node, str):
             return False
 
-        return re.search(SchedProcFSNode._re_procfs_node, node) is not None
+        if match is None:
+            match = SchedProcFSNode._re_procfs_node.match(node)
+        return match is not None
 
     @staticmethod
-    def _node_digits(node: str) -> int:
+    def _node_digits(node: str, match: Optional[Match] = None) -> int:
         """
         :returns: The ending digits of the procfs node
         """
-        return int(cast(Match, re.search(SchedProcFSNode._re_procfs_node, node)).group("digits"))
+        if match is None:
+            match = SchedProcFSNode._re_procfs_node.match(node)
+        return int(cast(Match, match).group("digits"))
 
     @staticmethod
-    def _node_name(node: str) -> str:
+    def _node_name(node: str, match: Optional[Match] = None) -> str:
         """
         :returns: The name of the procfs node
         """
-        match = re.search(SchedProcFSNode._re_procfs_node, node)
+        if match is None:
+            match = SchedProcFSNode._re_procfs_node.match(node)
         if match:
             return match.group("name")
 
         return node
 
     @classmethod
-    def _packable(cls, node: str) -> bool:
+    def _packable(cls, node: str, match: Optional[Match] = None) -> bool:
         """
         :returns: Whether it makes sense to pack a node into a common entry
         """
-        return (SchedProcFSNode._ends_with_digits(node) and
-                SchedProcFSNode._node_name(node) in cls.PACKABLE_ENTRIES)
+        if match is None and isinstance(node, str):
+            match = SchedProcFSNode._re_procfs_node.match(node)
+        return (SchedProcFSNode._ends_with_digits(node, match) and
+                SchedProcFSNode._node_name(node, match) in cls._PACKABLE_SET)
 
     @staticmethod
     def _build_directory(node_name: str,
@@ -128,33 +165,75 @@ class SchedProcFSNode(object):
             return SchedProcFSNode._build_entry(node_data)
 
     def __getattr__(self, name: str):
-        return self._dyn_attrs[name]
+        # Only reached for directories that have not been built yet
+        lazy_nodes = self.__dict__.get('_lazy_nodes')
+        if lazy_nodes is None or name not in lazy_nodes:
+            raise AttributeError(name)
+
+        node = self._build_directory(name, lazy_nodes[name])
+        self.__dict__[name] = node
+        return node
 
     def __init__(self, nodes: Dict[str, 'SchedProcFSNode']):
         self.procfs = nodes
-        # First, reduce the procs fields by packing them if possible
-        # Find which entries can be packed into a common entry
-        packables: Dict[str, str] = {
-            node: SchedProcFSNode._node_name(node) + "s"
-            for node in list(cast(SchedProcFSNode, nodes).keys()) if SchedProcFSNode._packable(node)
-        }
 
-        self._dyn_attrs: Dict[str, Any] = {}
+        # Entries are stored as plain instance attributes so that accessing
+        # them does not go through __getattr__. Directories are only built on
+        # first access, as callers typically only walk a few paths of the tree.
+        attrs: Dict[str, Any] = self.__dict__
+        lazy_nodes: Dict[str, Any] = {}
+        packable_set = self._PACKABLE_SET
+        pattern = SchedProcFSNode._re_procfs_node
+        for key, data in nodes.items():
+            match = pattern.match(key)
+            # Pack entries that can be into a common entry, e.g. "domain0" and
+            # "domain1" become domains[0] and domains[1]
+            if match is not None and match.group("name") in packable_set:
+                bucket_name = match.group("name") + "s"
+                bucket = attrs.get(bucket_name)
+                if bucket is None:
+                    bucket = attrs[bucket_name] = _LazyNodes()
+                bucket.add(int(match.group("digits")), key, data)
+            elif isinstance(data, dict):
+                lazy_nodes[key] = data
+            else:
+                attrs[key] = self._build_entry(data)
+
+        self._lazy_nodes = lazy_nodes
 
-        for dest in set(packables.values()):
-            self._dyn_attrs[dest] = {}
 
-        # Pack common entries
-        for key, dest in packables.items():
-            i: int = SchedProcFSNode._node_digits(key)
-            self._dyn_attrs[dest][i] = self._build_node(key, nodes[key])
+class _LazyNodes(Mapping):
+    """
+    Read-only mapping of packed :class:`SchedProcFSNode` entries, e.g. the
+    ``domains`` of a CPU, building each node on first access.
+    """
 
-        # Build the other nodes
-        for key in nodes.keys():
-            if key in packables:
-                continue
+    __slots__ = ('_raw', '_built')
 
-            self._dyn_attrs[key] = self._build_node(key, nodes[key])
+    def __init__(self):
+        self._raw: Dict[int, Tuple[str, Any]] = {}
+        self._built: Dict[int, Any] = {}
+
+    def add(self, index: int, node_name: str, node_data: Any) -> None:
+        self._raw[index] = (node_name, node_data)
+
+    def __getitem__(self, index: int) -> Any:
+        try:
+            return self._built[index]
+        except KeyError:
+            node_name, node_data = self._raw[index]
+            node = SchedProcFSNode._build_node(node_name, node_data)
+            self._built[index] = node
+            return node
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._raw)
+
+    def __len__(self) -> int:
+        return len(self._raw)
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
 
 
 class _SchedDomainFlag:
@@ -164,20 +243,39 @@ class _SchedDomainFlag:
     exposed.
     """
 
-    _INSTANCES: Dict['_SchedDomainFlag', '_SchedDomainFlag'] = {}
+    _INSTANCES: Dict[Tuple[str, int], '_SchedDomainFlag'] = {}
     """
-    Dictionary storing the instances so that they can be compared with ``is``
-    operator.
+    Dictionary storing the instances with a value by ``(name, value)`` so that
+    they can be compared with ``is`` operator.
+    """
+    _INSTANCES_NO_VALUE: Dict[str, '_SchedDomainFlag'] = {}
+    """
+    Same as :attr:`_INSTANCES` for the instances without value, i.e. the flags
+    parsed on recent kernels, stored by name.
     """
     name: str
     _value: Optional[int]
 
     def __new__(cls, name: str, value: Optional[int], doc: Optional[str] = None):
+        instances: Dict[Any, '_SchedDomainFlag']
+        if value is None:
+            instances = cls._INSTANCES_NO_VALUE
+            key: Any = name
+        else:
+            instances = cls._INSTANCES
+            key = (name, value)
+
+        try:
+            return instances[key]
+        except KeyError:
+            pass
+
         self = super().__new__(cls)
         self.name = name
         self._value = value
         self.__doc__ = doc
-        return cls._INSTANCES.setdefault(self, self)
+        instances[key] = self
+        return self
 
     def __eq__(self, other):
         # We *have to* check for "value" as well, otherwise it will be
@@ -185,7 +283,11 @@ class _SchedDomainFlag:
         return self.name == other.name and self._value == other._value
 
     def __hash__(self):
-        return hash((self.name, self._value))
+        value = self._value
+        if value is None:
+            return hash(self.name)
+        else:
+            return hash((self.name, value))
 
     @property
     def value(self) -> Optional[int]:
@@ -226,11 +328,31 @@ class _SchedDomainFlagMeta(type):
     """
     @property
     def _flags(self) -> List[Any]:
-        return [
-            attr
-            for name, attr in self.__dict__.items()
-            if name.startswith('SD_')
-        ]
+        # Flags never change after the class is created, so the list is only
+        # built once
+        try:
+            return self.__dict__['_flags_cache']
+        except KeyError:
+            flags = [
+                attr
+                for name, attr in self.__dict__.items()
+                if name.startswith('SD_')
+            ]
+            type.__setattr__(self, '_flags_cache', flags)
+            return flags
+
+    @property
+    def _by_value(self) -> Dict[int, Any]:
+        try:
+            return self.__dict__['_by_value_cache']
+        except KeyError:
+            by_value = {
+                flag._value: flag
+                for flag in self._flags
+                if flag._value is not None
+            }
+            type.__setattr__(self, '_by_value_cache', by_value)
+            return by_value
 
     def __getitem__(self, i):
         return self._flags[i]
@@ -251,7 +373,14 @@ class _SchedDomainFlagMeta(type):
 
     @property
     def __members__(self):
-        return {flag.name: flag for flag in self._flags}
+        try:
+            return self.__dict__['_members_cache']
+        except KeyError:
+            # Read-only view, as with enum.Enum, since it is shared by all
+            # the callers
+            members = MappingProxyType({flag.name: flag for flag in self._flags})
+            type.__setattr__(self, '_members_cache', members)
+            return members
 
 
 class SchedDomainFlag(_SchedDomainFlag, metaclass=_SchedDomainFlagMeta):
@@ -305,14 +434,18 @@ class SchedDomain(SchedProcFSNode):
                 for name in flags.split()
             }
         else:
-            def has_flag(flags: Set[_SchedDomainFlag], flag: _SchedDomainFlag):
-                return any(f.value == flag.value for f in flags)
-
-            flags = {
-                flag
-                for flag in SchedDomainFlag
-                if has_flag(flags, flag)
-            }
+            # Older kernels expose a packed bitfield: look up the flag of each
+            # bit set in it
+            by_value: Dict[int, Any] = SchedDomainFlag._by_value
+            bits = cast(int, flags)
+            flags = set()
+            while bits:
+                bit = bits & -bits
+                bits ^= bit
+                try:
+                    flags.add(by_value[bit])
+                except KeyError:
+                    pass
 
         self.flags = flags
 
@@ -335,7 +468,7 @@ class SchedProcFSData(SchedProcFSNode):
     _read_depth: int = 6
 
     @classmethod
-    def get_data_root(cls, target: 'Target'):
+    def get_data_root(cls, target: 'Target') -> str:
         # Location differs depending on kernel version
         paths = ['/sys/kernel/debug/sched/domains/', '/proc/sys/kernel/sched_domain']
         return _select_path(target, paths, "sched_domain debug directory")
@@ -356,11 +489,10 @@ class SchedProcFSData(SchedProcFSNode):
 
         # Even if we have a CPU entry, it can be empty (e.g. hotplugged out)
         # Make sure some data is there
-        for cpu in cpus:
-            if target.file_exists(target.path.join(path, cpu, "domain0", "flags")):
-                return True
-
-        return False
+        return target.file_exists_any([
+            target.path.join(path, cpu, "domain0", "flags")
+            for cpu in cpus
+        ])
 
     def __init__(self, target: 'Target', path: Optional[str] = None):
         if path is None:
@@ -387,8 +519,10 @@ class SchedModule(Module):
         # functionalities is enabled
         schedproc: bool = SchedProcFSData.available(target)
         debug: bool = SchedModule.target_has_debug(target)
-        dmips: bool = any([target.file_exists(SchedModule.cpu_dmips_capacity_path(target, cpu))
-                           for cpu in target.list_online_cpus()])
+        dmips: bool = target.file_exists_any([
+            SchedModule.cpu_dmips_capacity_path(target, cpu)
+            for cpu in target.list_online_cpus()
+        ])
 
         logger.info("Scheduler sched_domain procfs entries %s",
                     "found" if schedproc else "not found")
@@ -401,6 +535,19 @@ class SchedModule(Module):
 
     def __init__(self, target: 'Target'):
         super().__init__(target)
+        # Resolved lazily, see _get_features_path() and _get_data_root()
+        self._features_path: Optional[str] = None
+        self._sd_root: Optional[str] = None
+
+    def _get_features_path(self, refresh: bool = False) -> str:
+        if refresh or self._features_path is None:
+            self._features_path = self.get_sched_features_path(self.target)
+        return self._features_path
+
+    def _get_data_root(self, refresh: bool = False) -> str:
+        if refresh or self._sd_root is None:
+            self._sd_root = SchedProcFSData.get_data_root(self.target)
+        return self._sd_root
 
     @classmethod
     def get_sched_features_path(cls, target: 'Target') -> str:
@@ -433,15 +580,15 @@ class SchedModule(Module):
         output: str = self.target._execute_util(command, as_root=self.target.is_rooted,
                                                 check_exit_code=check_exit_code)
         result: Dict[str, Union[int, bool]] = {}
-        for entry in output.strip().split('\n'):
-            if ':' not in entry:
-                continue
-            path, value_s = entry.strip().split(':', 1)
-            if value_s in ['0', '1']:
-                value: Union[int, bool] = bool(int(value_s))
-            elif value_s.isdigit():
-                value = int(value_s)
-            result[path] = value
+        for match in _KV_RE.finditer(output):
+            path, value_s = match.groups()
+            if value_s == '0':
+                result[path] = False
+            elif value_s == '1':
+                result[path] = True
+            # Attributes with non-integer values are not reported
+            elif value_s.lstrip('-').isdigit():
+                result[path] = int(value_s)
         return result
 
     def set_kernel_attribute(self, attr: str, value: Union[bool, int, str],
@@ -482,15 +629,15 @@ class SchedModule(Module):
 
         :returns: a dictionary of features and their "is enabled" status
         """
-        feats: str = self.target.read_value(self.get_sched_features_path(self.target))
-        features: Dict[str, bool] = {}
-        for feat in feats.split():
-            value: bool = True
-            if feat.startswith('NO'):
-                feat = feat.replace('NO_', '', 1)
-                value = False
-            features[feat] = value
-        return features
+        try:
+            feats: str = self.target.read_value(self._get_features_path())
+        except TargetStableError:
+            # The file may have moved, e.g. if debugfs was remounted
+            feats = self.target.read_value(self._get_features_path(refresh=True))
+        return {
+            match.group(2): not match.group(1)
+            for match in _FEATURE_RE.finditer(feats)
+        }
 
     def set_feature(self, feature: str, enable: bool, verify: bool = True):
         """
@@ -506,8 +653,10 @@ class SchedModule(Module):
         feat_value: str = feature
         if not boolean(enable):
             feat_value = 'NO_' + feat_value
-        self.target.write_value(self.get_sched_features_path(self.target),
-                                feat_value, verify=False)
+        try:
+            self.target.write_value(self._get_features_path(), feat_value, verify=False)
+        except TargetStableError:
+            self.target.write_value(self._get_features_path(refresh=True), feat_value, verify=False)
         if not verify:
             return
         msg: str = 'Failed to set {}, feature not supported?'.format(feat_value)
@@ -521,7 +670,7 @@ class SchedModule(Module):
         :returns: An object view of the sched_domain debug directory of 'cpu'
         """
         path = self.target.path.join(
-            SchedProcFSData.get_data_root(self.target),
+            self._get_data_root(),
             "cpu{}".format(cpu)
         )
 
@@ -531,7 +680,7 @@ class SchedModule(Module):
         """
         :returns: An object view of the entire sched_domain debug directory
         """
-        return SchedProcFSData(self.target)
+        return SchedProcFSData(self.target, self._get_data_root())
 
     def get_capacity(self, cpu: int) -> int:
         """
@@ -554,9 +703,7 @@ class SchedModule(Module):
         """
         :returns: The target sysfs path where the dmips capacity data should be
         """
-        return target.path.join(
-            cls.cpu_sysfs_root,
-            'cpu{}/cpu_capacity'.format(cpu))
+        return _cpu_dmips_capacity_path(target.path, cls.cpu_sysfs_root, cpu)
 
     @memoized
     def has_dmips_capacity(self, cpu: int) -> bool:
@@ -575,11 +722,13 @@ class SchedModule(Module):
         if not sd:
             sd = self.get_cpu_sd_info(cpu)
 
-        cap_states: str = sd.domains[0].groups[0].energy.cap_states
-        cap_states_list: List[str] = cap_states.split('\t')
-        num_cap_states: int = sd.domains[0].groups[0].energy.nr_cap_states
-        max_cap_index: int = -1 * int(len(cap_states_list) / num_cap_states)
-        return int(cap_states_list[max_cap_index])
+        energy = sd.domains[0].groups[0].energy
+        cap_states: str = energy.cap_states
+        num_cap_states: int = energy.nr_cap_states
+        # Each state has the same number of tab-separated fields, the first one
+        # of the last state being the maximum capacity
+        stride: int = (cap_states.count('\t') + 1) // num_cap_states
+        return int(cap_states.rsplit('\t', stride)[-stride])
 
     @memoized
     def get_dmips_capacity(self, cpu: int) -> int:
@@ -590,6 +739,24 @@ class SchedModule(Module):
             self.cpu_dmips_capacity_path(self.target, cpu), int
         )
 
+    @memoized
+    def _get_dmips_capacities(self) -> Dict[int, int]:
+        """
+        :returns: The dmips capacity of all the CPUs that have one, read with
+            a single command.
+        """
+        # pylint: disable=protected-access
+        output: str = self.target._execute_util(
+            'sched_get_cpu_capacities {}'.format(quote(self.cpu_sysfs_root)),
+            as_root=self.target.is_rooted,
+            check_exit_code=False,
+        )
+        return {
+            int(match.group(1)): int(match.group(2))
+            for match in map(_CAPACITY_RE.match, output.splitlines())
+            if match is not None
+        }
+
     def get_capacities(self, default: Optional[int] = None) -> Dict[int, int]:
         """
         :param default: Default capacity value to find if no data is
@@ -604,15 +771,37 @@ class SchedModule(Module):
 
         capacities: Dict[int, int] = {}
 
-        for cpu in cpus:
-            if self.has_dmips_capacity(cpu):
-                capacities[cpu] = self.get_dmips_capacity(cpu)
+        try:
+            dmips_capacities = self._get_dmips_capacities()
+        except TargetStableError:
+            for cpu in cpus:
+                if self.has_dmips_capacity(cpu):
+                    capacities[cpu] = self.get_dmips_capacity(cpu)
+        else:
+            capacities.update(
+                (cpu, dmips_capacities[cpu])
+                for cpu in cpus
+                if cpu in dmips_capacities
+            )
 
         missing_cpus: Set[int] = set(cpus).difference(capacities.keys())
         if not missing_cpus:
             return capacities
 
-        if not SchedProcFSData.available(self.target):
+        # Only read the sched_domain data of the CPUs that need it when there
+        # are few of them, rather than the whole tree. Failing to read it
+        # means it is not available.
+        sd_infos: 'Optional[Mapping[int, Any]]'
+        try:
+            if len(missing_cpus) <= 2:
+                sd_infos = {cpu: self.get_cpu_sd_info(cpu) for cpu in missing_cpus}
+            else:
+                # The tree has no "cpus" entry if it lacks per-cpu directories
+                sd_infos = getattr(self.get_sd_info(), 'cpus', None)
+        except TargetStableError:
+            sd_infos = None
+
+        if sd_infos is None:
             if default is not None:
                 capacities.update({cpu: cast(int, default) for cpu in missing_cpus})
                 return capacities
@@ -620,10 +809,11 @@ class SchedModule(Module):
                 raise RuntimeError(
                     'No capacity data for cpus {}'.format(sorted(missing_cpus)))
 
-        sd_info: SchedProcFSData = self.get_sd_info()
         for cpu in missing_cpus:
-            if self.has_em(cpu, sd_info.cpus[cpu]):
-                capacities[cpu] = self.get_em_capacity(cpu, sd_info.cpus[cpu])
+            sd = sd_infos.get(cpu)
+            # The entry of a CPU can be empty, e.g. if it was hotplugged out
+            if sd is not None and "domain0" in sd.procfs and self.has_em(cpu, sd):
+                capacities[cpu] = self.get_em_capacity(cpu, sd)
             else:
                 if default is not None:
                     capacities[cpu] = cast(int, default)
@@ -13,16 +13,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import functools
 import os
+import re
 import time
 import tarfile
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from subprocess import CalledProcessError
 
 from devlib.module import HardRestModule, BootModule, FlashModule
 from devlib.exception import TargetError, TargetStableError, HostError
 from devlib.utils.misc import safe_extract
-from devlib.utils.serial_port import open_serial_connection, pulse_dtr, write_characters
+from devlib.utils.serial_port import open_serial_connection, pulse_dtr, write_lines, TIMEOUT
 from devlib.utils.uefi import UefiMenu, UefiConfig
 from devlib.utils.uboot import UbootMenu
 from devlib.platform.arm import VersatileExpressPlatform
@@ -32,7 +35,7 @@ try:
 # pexpect < 4.0.0 does not have fdpexpect module
 except ImportError:
     import fdpexpect    # type:ignore
-from typing import TYPE_CHECKING, cast, Optional, Dict, Union, Any
+from typing import TYPE_CHECKING, cast, Optional, Dict, Union, Any, List, Pattern, Set, Tuple
 if TYPE_CHECKING:
     from devlib.target import Target
 
@@ -41,6 +44,19 @@ OLD_AUTOSTART_MESSAGE: str = 'Press Enter to stop auto boot...'
 AUTOSTART_MESSAGE: str = 'Hit any key to stop autoboot:'
 POWERUP_MESSAGE: str = 'Powering up system...'
 DEFAULT_MCC_PROMPT: str = 'Cmd>'
+# IPv4 address in "ip addr" output that is not link-local
+ROUTABLE_INET_ADDRESS: str = r'inet (?!169\.254\.)[1-9]\d*\.\d+\.\d+\.\d+'
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_expect_patterns(*patterns: str) -> List[Pattern[bytes]]:
+    """
+    Compile ``expect()`` patterns once, the same way pexpect does for the
+    bytes-based spawns returned by
+    :func:`devlib.utils.serial_port.open_serial_connection`, so that they can
+    be passed to ``expect_list()``.
+    """
+    return [re.compile(p.encode('ascii'), re.DOTALL) for p in patterns]
 
 
 class VexpressDtrHardReset(HardRestModule):
@@ -53,14 +69,19 @@ class VexpressDtrHardReset(HardRestModule):
         return True
 
     def __init__(self, target: 'Target', port: str = '/dev/ttyS0', baudrate: int = 115200,
-                 mcc_prompt: str = DEFAULT_MCC_PROMPT, timeout: int = 300):
+                 mcc_prompt: str = DEFAULT_MCC_PROMPT, timeout: int = 300,
+                 low_latency: bool = True):
         super(VexpressDtrHardReset, self).__init__(target)
         self.port = port
         self.baudrate = baudrate
         self.mcc_prompt = mcc_prompt
         self.timeout = timeout
+        self.low_latency = low_latency
 
     def __call__(self):
+        # The sync has to go through the caller's connection: target.conn is
+        # per-thread, so running it from a worker thread would open a new
+        # connection to a target that is about to be reset.
         try:
             if self.target.is_connected:
                 self.target.execute('sync')
@@ -70,6 +91,7 @@ class VexpressDtrHardReset(HardRestModule):
                                     baudrate=self.baudrate,
                                     timeout=self.timeout,
                                     init_dtr=False,
+                                    low_latency=self.low_latency,
                                     get_conn=True) as (_, conn):
             pulse_dtr(conn, state=True, duration=0.1)  # TRM specifies a pulse of >=100ms
 
@@ -86,7 +108,8 @@ class VexpressReboottxtHardReset(HardRestModule):
     def __init__(self, target: 'Target',
                  port: str = '/dev/ttyS0', baudrate: int = 115200,
                  path: str = '/media/VEMSD',
-                 mcc_prompt: str = DEFAULT_MCC_PROMPT, timeout: int = 30, short_delay: int = 1):
+                 mcc_prompt: str = DEFAULT_MCC_PROMPT, timeout: int = 30, short_delay: int = 1,
+                 low_latency: bool = True):
         super(VexpressReboottxtHardReset, self).__init__(target)
         self.port = port
         self.baudrate = baudrate
@@ -94,6 +117,7 @@ class VexpressReboottxtHardReset(HardRestModule):
         self.mcc_prompt = mcc_prompt
         self.timeout = timeout
         self.short_delay = short_delay
+        self.low_latency = low_latency
         self.filepath = os.path.join(path, 'reboot.txt')
 
     def __call__(self):
@@ -108,10 +132,12 @@ class VexpressReboottxtHardReset(HardRestModule):
             with open_serial_connection(port=self.port,
                                         baudrate=self.baudrate,
                                         timeout=self.timeout,
-                                        init_dtr=False) as tty:
+                                        init_dtr=False,
+                                        low_latency=self.low_latency) as tty:
                 wait_for_vemsd(self.path, tty, self.mcc_prompt, self.short_delay)
-        with open(self.filepath, 'w'):
-            pass
+        # Only the presence of the file matters, so create it without going
+        # through a truncating, buffered Python file object
+        os.close(os.open(self.filepath, os.O_WRONLY | os.O_CREAT, 0o644))
 
 
 class VexpressBootModule(BootModule):
@@ -125,7 +151,9 @@ class VexpressBootModule(BootModule):
     def __init__(self, target: 'Target', uefi_entry: Optional[str] = None,
                  port: str = '/dev/ttyS0', baudrate: int = 115200,
                  mcc_prompt: str = DEFAULT_MCC_PROMPT,
-                 timeout: int = 120, short_delay: int = 1):
+                 timeout: int = 120, short_delay: int = 1,
+                 char_delay: Optional[float] = 0.05,
+                 low_latency: bool = True):
         super(VexpressBootModule, self).__init__(target)
         self.port = port
         self.baudrate = baudrate
@@ -133,12 +161,17 @@ class VexpressBootModule(BootModule):
         self.mcc_prompt = mcc_prompt
         self.timeout = timeout
         self.short_delay = short_delay
+        # Delay between characters written to the boot loader, or None to
+        # write whole commands at once on consoles that do not drop characters
+        self.char_delay = char_delay
+        self.low_latency = low_latency
 
     def __call__(self):
         with open_serial_connection(port=self.port,
                                     baudrate=self.baudrate,
                                     timeout=self.timeout,
-                                    init_dtr=False) as tty:
+                                    init_dtr=False,
+                                    low_latency=self.low_latency) as tty:
             self.get_through_early_boot(tty)
             self.perform_boot_sequence(tty)
             self.wait_for_shell_prompt(tty)
@@ -155,7 +188,8 @@ class VexpressBootModule(BootModule):
         """
         self.logger.debug('Establishing initial state...')
         tty.sendline('')
-        i: int = tty.expect([AUTOSTART_MESSAGE, OLD_AUTOSTART_MESSAGE, POWERUP_MESSAGE, self.mcc_prompt])
+        i: int = tty.expect_list(_compile_expect_patterns(AUTOSTART_MESSAGE, OLD_AUTOSTART_MESSAGE,
+                                                          POWERUP_MESSAGE, self.mcc_prompt))
         if i == 3:
             self.logger.debug('Saw MCC prompt.')
             time.sleep(self.short_delay)
@@ -179,10 +213,23 @@ class VexpressBootModule(BootModule):
     def wait_for_shell_prompt(self, tty: fdpexpect.fdspawn) -> None:
         self.logger.debug('Waiting for the shell prompt.')
         tty.expect(self.target.shell_prompt, timeout=self.timeout)
-        # This delay is needed to allow the platform some time to finish
-        # initilizing; querying the ip address too early from connect() may
-        # result in a bogus address being assigned to eth0.
-        time.sleep(5)
+        # The platform needs some time to finish initilizing; querying the ip
+        # address too early from connect() may result in a bogus address being
+        # assigned to eth0. Wait for a routable address to show up, for up to
+        # 5 seconds.
+        deadline: float = time.monotonic() + 5
+        address_patterns: List[Pattern[bytes]] = _compile_expect_patterns(ROUTABLE_INET_ADDRESS)
+        while True:
+            remaining: float = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            tty.sendline('ip -4 addr show eth0')
+            try:
+                tty.expect_list(address_patterns, timeout=min(0.5, max(remaining, 0.1)))
+            except TIMEOUT:
+                continue
+            else:
+                break
 
 
 class VexpressUefiBoot(VexpressBootModule):
@@ -249,7 +296,7 @@ class VexpressUefiShellBoot(VexpressBootModule):
             time.sleep(self.short_delay)
             efi_shell_command = '{} {}'.format(self.image, self.bootargs)
             self.logger.debug(efi_shell_command)
-            write_characters(tty, efi_shell_command)
+            write_lines(tty, [efi_shell_command], delay=self.char_delay)
             tty.sendline('\r\n')
 
 
@@ -270,8 +317,7 @@ class VexpressUBoot(VexpressBootModule):
         menu = UbootMenu(tty)
         self.logger.debug('Waiting for U-Boot prompt...')
         menu.open(timeout=120)
-        for var, value in self.env.items():
-            menu.setenv(var, value)
+        menu.setenv_many(self.env)
         menu.boot()
 
 
@@ -299,14 +345,11 @@ class VexpressBootmon(VexpressBootModule):
 
         time.sleep(self.short_delay)
         tty.expect(self.bootmon_prompt, timeout=self.timeout)
-        with open_serial_connection(port=self.port,
-                                    baudrate=self.baudrate,
-                                    timeout=self.timeout,
-                                    init_dtr=False) as tty_conn:
-            write_characters(tty_conn, 'fl linux fdt {}'.format(self.fdt))
-            write_characters(tty_conn, 'fl linux initrd {}'.format(self.initrd))
-            write_characters(tty_conn, 'fl linux boot {} {}'.format(self.image,
-                                                                    self.bootargs))
+        write_lines(tty, [
+            'fl linux fdt {}'.format(self.fdt),
+            'fl linux initrd {}'.format(self.initrd),
+            'fl linux boot {} {}'.format(self.image, self.bootargs),
+        ], delay=self.char_delay)
 
 
 class VersatileExpressFlashModule(FlashModule):
@@ -336,12 +379,14 @@ class VersatileExpressFlashModule(FlashModule):
         return True
 
     def __init__(self, target: 'Target', vemsd_mount: str,
-                 mcc_prompt: str = DEFAULT_MCC_PROMPT, timeout: int = 30, short_delay: int = 1):
+                 mcc_prompt: str = DEFAULT_MCC_PROMPT, timeout: int = 30, short_delay: int = 1,
+                 low_latency: bool = True):
         super(VersatileExpressFlashModule, self).__init__(target)
         self.vemsd_mount = vemsd_mount
         self.mcc_prompt = mcc_prompt
         self.timeout = timeout
         self.short_delay = short_delay
+        self.low_latency = low_latency
 
     def __call__(self, image_bundle: Optional[str] = None,
                  images: Optional[Dict[str, str]] = None,
@@ -350,9 +395,11 @@ class VersatileExpressFlashModule(FlashModule):
         with open_serial_connection(port=cast(VersatileExpressPlatform, self.target.platform).serial_port,
                                     baudrate=cast(VersatileExpressPlatform, self.target.platform).baudrate,
                                     timeout=self.timeout,
-                                    init_dtr=False) as tty:
+                                    init_dtr=False,
+                                    low_latency=self.low_latency) as tty:
             # pylint: disable=no-member
-            i: int = cast(fdpexpect.fdspawn, tty).expect([self.mcc_prompt, AUTOSTART_MESSAGE, OLD_AUTOSTART_MESSAGE])
+            i: int = cast(fdpexpect.fdspawn, tty).expect_list(
+                _compile_expect_patterns(self.mcc_prompt, AUTOSTART_MESSAGE, OLD_AUTOSTART_MESSAGE))
             if i:
                 cast(fdpexpect.fdspawn, tty).sendline('')  # pylint: disable=no-member
             wait_for_vemsd(self.vemsd_mount, tty, self.mcc_prompt, self.short_delay)
@@ -361,7 +408,7 @@ class VersatileExpressFlashModule(FlashModule):
                 self._deploy_image_bundle(image_bundle)
             if images:
                 self._overlay_images(images)
-            os.system('sync')
+            os.sync()
         except (IOError, OSError) as e:
             msg: str = 'Could not deploy images to {}; got: {}'
             raise TargetStableError(msg.format(self.vemsd_mount, e))
@@ -371,32 +418,75 @@ class VersatileExpressFlashModule(FlashModule):
 
     def _deploy_image_bundle(self, bundle: str) -> None:
         self.logger.debug('Validating {}'.format(bundle))
-        validate_image_bundle(bundle)
-        self.logger.debug('Extracting {} into {}...'.format(bundle, self.vemsd_mount))
-        with tarfile.open(bundle) as tar:
+        # Validate and extract with the same TarFile so the bundle is only
+        # indexed once
+        with _open_image_bundle(bundle) as tar:
+            _check_image_bundle(bundle, tar)
+            self.logger.debug('Extracting {} into {}...'.format(bundle, self.vemsd_mount))
             safe_extract(tar, self.vemsd_mount)
 
     def _overlay_images(self, images: Dict[str, str]):
+        # Resolve destinations first so that two entries for the same file
+        # cannot be copied concurrently, the last one winning as before
+        copies: Dict[str, str] = {}
         for dest, src in images.items():
             dest = os.path.join(self.vemsd_mount, dest)
+            if os.path.isdir(dest):
+                dest = os.path.join(dest, os.path.basename(src))
+            copies[os.path.normpath(dest)] = src
+        if not copies:
+            return
+
+        def copy(dest: str, src: str) -> None:
             self.logger.debug('Copying {} to {}'.format(src, dest))
-            shutil.copy(src, dest)
+            # copyfile() uses the in-kernel sendfile() fast path. Modes are not
+            # copied as the FAT filesystem of the MicroSD has none.
+            shutil.copyfile(src, dest)
+
+        # Writes to the MicroSD are slow, so keep several in flight
+        with ThreadPoolExecutor(max_workers=min(4, len(copies))) as pool:
+            # Consume the results to propagate any exception
+            list(pool.map(copy, copies.keys(), copies.values()))
 
 
 # utility functions
 
+# Image bundles already validated, by (path, mtime, size) so that a bundle
+# modified in place is validated again
+_VALIDATED_BUNDLES: Set[Tuple[str, int, int]] = set()
+
+
+def _bundle_key(bundle: str) -> Tuple[str, int, int]:
+    st = os.stat(bundle)
+    return (os.path.realpath(bundle), st.st_mtime_ns, st.st_size)
+
+
 def validate_image_bundle(bundle: str) -> None:
-    if not tarfile.is_tarfile(bundle):
+    key = _bundle_key(bundle)
+    if key in _VALIDATED_BUNDLES:
+        return
+    with _open_image_bundle(bundle) as tar:
+        _check_image_bundle(bundle, tar)
+
+
+def _open_image_bundle(bundle: str) -> tarfile.TarFile:
+    try:
+        return tarfile.open(bundle)
+    except tarfile.ReadError:
         raise HostError('Image bundle {} does not appear to be a valid TAR file.'.format(bundle))
-    with tarfile.open(bundle) as tar:
-        try:
-            tar.getmember('config.txt')
-        except KeyError:
-            try:
-                tar.getmember('./config.txt')
-            except KeyError:
-                msg = 'Tarball {} does not appear to be a valid image bundle (did not see config.txt).'
-                raise HostError(msg.format(bundle))
+
+
+def _check_image_bundle(bundle: str, tar: tarfile.TarFile) -> None:
+    # Members are read lazily, so stop at config.txt instead of indexing the
+    # whole bundle: it is usually one of the first members. Any extraction
+    # carries on from there.
+    for member in tar:
+        if member.name in ('config.txt', './config.txt'):
+            break
+    else:
+        msg = 'Tarball {} does not appear to be a valid image bundle (did not see config.txt).'
+        raise HostError(msg.format(bundle))
+    _VALIDATED_BUNDLES.add(_bundle_key(bundle))
 
 
 def wait_for_vemsd(vemsd_mount: str, tty: fdpexpect.fdspawn,
@@ -406,11 +496,19 @@ def wait_for_vemsd(vemsd_mount: str, tty: fdpexpect.fdspawn,
     path: str = os.path.join(vemsd_mount, 'config.txt')
     if os.path.exists(path):
         return
+    prompt_patterns: List[Pattern[bytes]] = _compile_expect_patterns(mcc_prompt)
     for _ in range(attempts):
         tty.sendline('')  # clear any garbage
-        tty.expect(mcc_prompt, timeout=short_delay)
+        tty.expect_list(prompt_patterns, timeout=short_delay)
         tty.sendline('usb_on')
-        time.sleep(short_delay * 3)
-        if os.path.exists(path):
-            return
+        # Return as soon as the host has mounted the MicroSD rather than always
+        # waiting for the whole delay
+        deadline: float = time.monotonic() + short_delay * 3
+        while True:
+            if os.path.exists(path):
+                return
+            remaining: float = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(0.1, remaining))
     raise TargetStableError('Could not mount {}'.format(vemsd_mount))
@@ -14,13 +14,14 @@
 #
 
 from typing import Optional, List, TYPE_CHECKING, cast, Dict
+from devlib.exception import TargetStableError
 from devlib.utils.misc import get_logger
 if TYPE_CHECKING:
     from devlib.target import Target, AndroidTarget
     from devlib.utils.types import caseless_string
 
 
-BIG_CPUS = ['A15', 'A57', 'A72', 'A73']
+BIG_CPUS = frozenset(['A15', 'A57', 'A72', 'A73'])
 
 
 class Platform(object):
@@ -60,10 +61,10 @@ class Platform(object):
         if not self.core_names:
             self.core_names = target.cpuinfo.cpu_names
             self._set_core_clusters_from_core_names()
+        elif not self.core_clusters:
+            self._set_core_clusters_from_core_names()
         if not self.big_core and self.number_of_clusters == 2:
             self.big_core = self._identify_big_core()
-        if not self.core_clusters and self.core_names:
-            self._set_core_clusters_from_core_names()
         if not self.model:
             self._set_model_from_target(target)
         if not self.name:
@@ -79,12 +80,14 @@ class Platform(object):
         pass
 
     def _set_core_clusters_from_core_names(self) -> None:
-        self.core_clusters = []
-        clusters: List[str] = []
-        for cn in self.core_names:
-            if cn not in clusters:
-                clusters.append(cn)
-            self.core_clusters.append(clusters.index(cn))
+        # Map each core name to its cluster index, in order of appearance. This
+        # is linear in the number of cores and, unlike numpy.unique(), keeps
+        # the case-insensitive comparison of caseless_string names.
+        clusters: Dict[str, int] = {}
+        self.core_clusters = [
+            clusters.setdefault(cn, len(clusters))
+            for cn in self.core_names
+        ]
 
     def _set_model_from_target(self, target: 'Target'):
         if target.os == 'android':
@@ -92,13 +95,19 @@ class Platform(object):
                 self.model = cast('AndroidTarget', target).getprop(prop='ro.product.device')
             except KeyError:
                 self.model = cast('AndroidTarget', target).getprop('ro.product.model')
-        elif target.file_exists("/proc/device-tree/model"):
-            # There is currently no better way to do this cross platform.
-            # ARM does not have dmidecode
-            raw_model = target.execute("cat /proc/device-tree/model")
-            device_model_to_return = '_'.join(raw_model.split()[:2])
-            return device_model_to_return.rstrip(' \t\r\n\0')
-        elif target.is_rooted:
+            return
+
+        # There is currently no better way to do this cross platform.
+        # ARM does not have dmidecode
+        try:
+            raw_model: str = target.read_value('/proc/device-tree/model')
+        except TargetStableError:
+            pass
+        else:
+            self.model = '_'.join(raw_model.split()[:2]).rstrip(' \t\r\n\0')
+            return
+
+        if target.is_rooted:
             try:
                 self.model = target.execute('dmidecode -s system-version',
                                             as_root=True).strip()
@@ -121,7 +130,7 @@ class Platform(object):
         if self.big_core and self.big_core not in self.core_names:
             message: str = 'Invalid big_core value "{}"; must be in [{}]'
             raise ValueError(message.format(self.big_core,
-                                            ', '.join(set(self.core_names))))
+                                            ', '.join(dict.fromkeys(self.core_names))))
         if self.big_core:
             for core in self.core_names:
                 if core != self.big_core:
@@ -501,14 +501,31 @@ class Target(object):
         return [self.abi]
 
     @property
-    @memoized
     def cpuinfo(self) -> 'Cpuinfo':
         """
         Parsed data from ``/proc/cpuinfo``.
 
         :return: A :class:`Cpuinfo` instance with CPU details.
         """
-        return Cpuinfo(self.execute('cat /proc/cpuinfo'))
+        return self.get_cpuinfo()
+
+    def get_cpuinfo(self, refresh: bool = False) -> 'Cpuinfo':
+        """
+        Parsed data from ``/proc/cpuinfo``. The file is only read and parsed
+        once, and the result is shared by all the callers.
+
+        :param refresh: If ``True``, read the file again, e.g. to get
+            up-to-date ``cpu MHz`` values, and cache the new result.
+        :return: A :class:`Cpuinfo` instance with CPU details.
+        """
+        if not refresh:
+            try:
+                return self._cache['cpuinfo']
+            except KeyError:
+                pass
+        cpuinfo = Cpuinfo(self.execute('cat /proc/cpuinfo'))
+        self._cache['cpuinfo'] = cpuinfo
+        return cpuinfo
 
     @property
     @memoized
@@ -1756,6 +1773,77 @@ fi
             else:
                 raise
 
+    @asyn.asyncf
+    async def batch_write_values(self, values: Iterable[Tuple[str, Any]], verify: bool = True,
+                                 as_root: bool = True) -> None:
+        """
+        Same as :meth:`write_value` for several files, using a single command
+        on the target. The files are written in the given order, stopping at
+        the first failure.
+
+        :param values: Iterable of ``(path, value)`` pairs.
+        :param verify: If ``True`` (the default) each value will be read back
+            after it is written, as in :meth:`write_value`.
+        :param as_root: specifies if writing requires being root. Its default value
+            is ``True``.
+
+        :raises TargetStableError: If a write or verification fails.
+        """
+        values_list: List[Tuple[str, str]] = [(path, str(value)) for path, value in values]
+        if not values_list:
+            return
+        for path, _ in values_list:
+            self.async_manager.track_access(
+                asyn.PathAccess(namespace='target', path=path, mode='w')
+            )
+
+        # The path of a failing write is reported between \x1e separators,
+        # followed by the value read back if the verification failed.
+        if verify:
+            func = '''
+_devlib_write() {{
+    orig=$(cat "$1" 2>/dev/null || printf "")
+    printf "%s" "$2" > "$1" || {{ printf "\\036%s\\036" "$1"; exit 10; }}
+    if [ "$2" != "$orig" ]; then
+        trials=0
+        while [ "$(cat "$1" 2>/dev/null)" != "$2" ]; do
+            if [ $trials -ge 10 ]; then
+                printf "\\036%s\\036" "$1"
+                cat "$1"
+                exit 11
+            fi
+            sleep 0.01
+            trials=$((trials + 1))
+        done
+    fi
+}}
+'''
+        else:
+            func = '''
+_devlib_write() {{
+    {busybox} printf "%s" "$2" > "$1" || {{ printf "\\036%s\\036" "$1"; exit 10; }}
+}}
+'''
+        cmd = func.format(busybox=quote(self.busybox) if self.busybox else '') + ''.join(
+            '_devlib_write {} {}\n'.format(quote(path), quote(value))
+            for path, value in values_list
+        )
+
+        try:
+            await self.execute.asyn(cmd, check_exit_code=True, as_root=as_root)
+        except TargetCalledProcessError as e:
+            if e.returncode not in (10, 11):
+                raise
+            head, _, rest = (e.output or '').partition('\x1e')
+            path, _, out = rest.partition('\x1e')
+            string_value = dict(values_list).get(path, '')
+            if e.returncode == 10:
+                raise TargetStableError('Could not write "{string_value}" to {path}: {output}'.format(
+                    string_value=string_value, path=path, output=(head + out).strip()))
+            else:
+                message = 'Could not set the value of {} to "{}" (read "{}")'.format(path, string_value, out)
+                raise TargetStableError(message)
+
     @asyn.asynccontextmanager
     async def make_temp(self, is_directory: Optional[bool] = True, directory: Optional[str] = None,
                         prefix: Optional[str] = None) -> AsyncGenerator:
@@ -1878,6 +1966,25 @@ fi
         output: str = await self.execute.asyn(command.format(quote(filepath)), as_root=self.is_rooted)
         return boolean(output.strip())
 
+    @asyn.asyncf
+    async def file_exists_any(self, filepaths: Iterable[str]) -> bool:
+        """
+        Check if at least one of the given paths exists, using a single
+        command on the target that stops at the first existing path.
+
+        :param filepaths: The target paths to check.
+        :return: True if any of the paths exists on the target, else False.
+        """
+        tests = ' || '.join(
+            '[ -e {} ]'.format(quote(filepath))
+            for filepath in filepaths
+        )
+        if not tests:
+            return False
+        command = 'if {}; then echo 1; else echo 0; fi'.format(tests)
+        output: str = await self.execute.asyn(command, as_root=self.is_rooted)
+        return boolean(output.strip())
+
     @asyn.asyncf
     async def directory_exists(self, filepath: str) -> bool:
         """
@@ -2176,6 +2283,16 @@ fi
         else:
             return True
 
+    def get_installed_module(self, modname: str) -> Optional[Module]:
+        """
+        Get a module that is already installed on the target. Unlike accessing
+        the module attribute or :meth:`has`, this never tries to install it.
+
+        :param modname: Module name to look up.
+        :return: The module if it is installed, otherwise ``None``.
+        """
+        return self._installed_modules.get(identifier(modname))
+
     @asyn.asyncf
     async def lsmod(self) -> List['LsmodEntry']:
         """
@@ -4284,6 +4401,10 @@ class Cpuinfo(object):
 
     def __init__(self, text: str):
         self.sections: List[Dict[str, str]] = []
+        # The fields of the processor entries, mapping each field name (e.g.
+        # ``processor`` or ``cpu MHz``) to the list of its values, one per
+        # processor entry. Entries lacking a field have ``None`` in its list.
+        self.columns: Dict[str, List[Optional[str]]] = {}
         self.text = ''
         self.parse(text)
 
@@ -4327,6 +4448,16 @@ class Cpuinfo(object):
                 self.sections.append(current_section)
                 current_section = {}
         self.sections.append(current_section)
+        processors = [section for section in self.sections if 'processor' in section]
+        self.columns = {}
+        for i, section in enumerate(processors):
+            for key, value in section.items():
+                try:
+                    self.columns[key][i] = value
+                except KeyError:
+                    column: List[Optional[str]] = [None] * len(processors)
+                    column[i] = value
+                    self.columns[key] = column
 
     def __str__(self):
         return 'CpuInfo({})'.format(self.cpu_names)
@@ -795,13 +795,15 @@ class AdbConnection(ConnectionBase):
 
 
 def fastboot_command(command: str, timeout: Optional[int] = None,
-                     device: Optional[str] = None) -> str:
+                     device: Optional[str] = None,
+                     env: Optional[Dict[str, str]] = None) -> str:
     """
     Execute a fastboot command, optionally targeted at a specific device.
 
     :param command: The fastboot subcommand (e.g. 'devices', 'flash').
     :param timeout: Time in seconds before the command fails.
     :param device: Fastboot device name. If None, assumes a single device or environment default.
+    :param env: Environment to run fastboot with. If None, the current environment is used.
     :returns: Combined stdout+stderr output from the fastboot command.
     :raises HostError: If the command fails or returns an error.
     """
@@ -809,7 +811,7 @@ def fastboot_command(command: str, timeout: Optional[int] = None,
     bin_: str = cast(str, _ANDROID_ENV.get_env('fastboot'))
     full_command: str = f'{bin_} {target} {command}'
     logger.debug(full_command)
-    output, _ = check_output(full_command, timeout, shell=True)
+    output, _ = check_output(full_command, timeout, shell=True, env=env)
     return output
 
 
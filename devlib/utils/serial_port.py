@@ -13,6 +13,7 @@
 # limitations under the License.
 #
 
+import os
 import time
 from contextlib import contextmanager
 from logging import Logger
@@ -32,7 +33,7 @@ from pexpect import EOF, TIMEOUT  # NOQA pylint: disable=W0611
 
 from devlib.exception import HostError
 
-from typing import Optional, TextIO, Union, Tuple
+from typing import Optional, TextIO, Union, Tuple, Iterable
 from collections.abc import Generator
 
 
@@ -73,6 +74,9 @@ def get_connection(timeout: int, init_dtr: Optional[bool] = None,
     target: fdpexpect.fdspawn = fdpexpect.fdspawn(conn.fileno(), timeout=timeout, logfile=logfile)
     target.logfile_read = logcls('read')
     target.logfile_send = logcls('send')
+    # Reads wait on select() already, there is no need for expect() to also
+    # sleep after each of them
+    target.delayafterread = None
 
     # Monkey-patching sendline to introduce a short delay after
     # chacters are sent to the serial. If two sendline s are issued
@@ -100,12 +104,64 @@ def write_characters(conn: fdpexpect.fdspawn, line: str, delay: float = 0.05) ->
     conn.sendline('')
 
 
+def write_lines(conn: fdpexpect.fdspawn, lines: Iterable[str], delay: Optional[float] = None) -> None:
+    """Write several lines out to serial with a single write.
+
+    :param delay: If not ``None``, write each line character-by-character with
+        that delay instead, as :func:`write_characters` does, for devices that
+        would otherwise drop characters."""
+    if delay is None:
+        conn.send(''.join(line.rstrip('\r\n') + os.linesep for line in lines))
+    else:
+        for line in lines:
+            write_characters(conn, line, delay)
+
+
+@contextmanager
+def usb_serial_low_latency(port: Optional[str]) -> Generator[None, None, None]:
+    """
+    Lower the latency timer of a USB-serial adapter (e.g. FTDI) to 1ms for the
+    duration of the context, so that reading a reply does not wait up to the
+    default 16ms for the adapter to flush its buffer. The previous value is
+    restored on exit.
+
+    This is best-effort: nothing is done if the port is not a USB-serial
+    adapter or if the latency timer cannot be written to.
+    """
+    path: Optional[str] = None
+    previous: Optional[str] = None
+    if port:
+        name = os.path.basename(os.path.realpath(port))
+        path = '/sys/bus/usb-serial/devices/{}/latency_timer'.format(name)
+        try:
+            with open(path) as f:
+                previous = f.read().strip()
+            if previous == '1':
+                previous = None
+            else:
+                with open(path, 'w') as f:
+                    f.write('1')
+        except OSError:
+            previous = None
+
+    try:
+        yield
+    finally:
+        if path is not None and previous is not None:
+            try:
+                with open(path, 'w') as f:
+                    f.write(previous)
+            except OSError:
+                pass
+
+
 # pylint: disable=keyword-arg-before-vararg
 @contextmanager
 def open_serial_connection(timeout: int, get_conn: bool = False,
                            init_dtr: Optional[bool] = None,
-                           logcls=SerialLogger, *args, **kwargs) -> Generator[Union[Tuple[fdpexpect.fdspawn, serial.Serial],
-                                                                                    fdpexpect.fdspawn], None, None]:
+                           logcls=SerialLogger, *args,
+                           low_latency: bool = False, **kwargs) -> Generator[Union[Tuple[fdpexpect.fdspawn, serial.Serial],
+                                                                                   fdpexpect.fdspawn], None, None]:
     """
     Opens a serial connection to a device.
 
@@ -113,6 +169,8 @@ def open_serial_connection(timeout: int, get_conn: bool = False,
     :param conn: ``bool`` that specfies whether the underlying connection
                  object should be yielded as well.
     :param init_dtr: specifies the initial DTR state stat should be set.
+    :param low_latency: lower the latency timer of the port if it is a
+                        USB-serial adapter, see :func:`usb_serial_low_latency`.
 
     All arguments are passed into the __init__ of serial.Serial. See
     pyserial documentation for details:
@@ -123,15 +181,17 @@ def open_serial_connection(timeout: int, get_conn: bool = False,
               See: http://pexpect.sourceforge.net/pexpect.html
 
     """
-    target, conn = get_connection(timeout, init_dtr,
-                                  logcls, *args, **kwargs)
-
-    if get_conn:
-        target_and_conn: Union[Tuple[fdpexpect.fdspawn, serial.Serial], fdpexpect.fdspawn] = (target, conn)
-    else:
-        target_and_conn = target
-
-    try:
-        yield target_and_conn
-    finally:
-        target.close()  # Closes the file descriptor used by the conn.
+    port: Optional[str] = kwargs.get('port', args[0] if args else None)
+    with usb_serial_low_latency(port if low_latency else None):
+        target, conn = get_connection(timeout, init_dtr,
+                                      logcls, *args, **kwargs)
+
+        if get_conn:
+            target_and_conn: Union[Tuple[fdpexpect.fdspawn, serial.Serial], fdpexpect.fdspawn] = (target, conn)
+        else:
+            target_and_conn = target
+
+        try:
+            yield target_and_conn
+        finally:
+            target.close()  # Closes the file descriptor used by the conn.
@@ -71,12 +71,36 @@ class UbootMenu(object):
         return result
 
     def setenv(self, variable, value, force=False):
+        return self.enter(self._setenv_command(variable, value, force))
+
+    def setenv_many(self, env, force=False, delay=load_delay):
+        """Like ``setenv()`` for each item of the ``env`` mapping, except that all
+        the commands are sent before waiting for their prompts, rather than
+        emptying the buffer and waiting for the prompt after each of them.
+
+        :returns: The output of each command, in order.
+        """
+        commands = [
+            self._setenv_command(variable, value, force)
+            for variable, value in env.items()
+        ]
+        self.empty_buffer()
+        for command in commands:
+            self.write_characters(command)
+
+        outputs = []
+        for _ in commands:
+            self.conn.expect(self.prompt, timeout=delay)
+            outputs.append(self.conn.before)
+        return outputs
+
+    @staticmethod
+    def _setenv_command(variable, value, force=False):
         force_str = ' -f' if force else ''
         if value is not None:
-            command = 'setenv{} {} {}'.format(force_str, variable, value)
+            return 'setenv{} {} {}'.format(force_str, variable, value)
         else:
-            command = 'setenv{} {}'.format(force_str, variable)
-        return self.enter(command)
+            return 'setenv{} {}'.format(force_str, variable)
 
     def boot(self):
         self.write_characters('boot')
@@ -111,4 +135,4 @@ class UbootMenu(object):
                 self.conn.read_nonblocking(size=1024, timeout=0.1)
         except TIMEOUT:
             pass
-        self.conn.buffer = ''
+        self.conn.buffer = self.conn.string_type()
@@ -115,6 +115,7 @@ params = dict(
         'doc': ['sphinx'],
         'monsoon': ['python-gflags'],
         'acme': ['pandas', 'numpy'],
+        'fastboot': ['fastar'],  # Faster image bundle extraction
         'dev': [
             'uvloop',  # Test async features under uvloop
         ]
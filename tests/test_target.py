@@ -30,6 +30,7 @@ import pytest
 
 from devlib import AndroidTarget, ChromeOsTarget, LinuxTarget, LocalLinuxTarget
 from devlib._target_runner import NOPTargetRunner, QEMUTargetRunner
+from devlib.exception import TargetStableError
 from devlib.utils.android import AdbConnection
 from devlib.utils.misc import load_struct_from_yaml, get_logger
 
@@ -178,3 +179,66 @@ def test_read_multiline_values(build_target_runners):
             result = {os.path.basename(k): v for k, v in raw_result.items()}
 
         assert {k: v.strip() for k, v in data.items()} == result
+
+
+# pylint: disable=redefined-outer-name
+def test_batch_write_values(build_target_runners):
+    """
+    Test Target.batch_write_values()
+
+    Checks that all the values are written, and that a failed write or a failed
+    verification is reported with the offending path and the value read back.
+    """
+
+    logger.info('Running test_batch_write_values test...')
+
+    target_runners = build_target_runners
+    for target_runner in target_runners:
+        target = target_runner.target
+        as_root = target.conn.connected_as_root
+
+        with target.make_temp() as tempdir:
+            paths = [os.path.join(tempdir, 'test{}'.format(i)) for i in range(3)]
+
+            logger.debug('Writing a batch of values to %s...', tempdir)
+            target.batch_write_values([(path, i) for i, path in enumerate(paths)], as_root=as_root)
+            assert [target.read_value(path) for path in paths] == ['0', '1', '2']
+
+            # The parent directory does not exist, so the write fails (exit 10)
+            missing = os.path.join(tempdir, 'missing', 'test')
+            with pytest.raises(TargetStableError) as excinfo:
+                target.batch_write_values([(paths[0], 'a'), (missing, 'b'), (paths[1], 'c')],
+                                          as_root=as_root)
+            assert 'Could not write "b" to {}'.format(missing) in str(excinfo.value)
+            # The batch stops at the first failure
+            assert target.read_value(paths[0]) == 'a'
+            assert target.read_value(paths[1]) == '1'
+
+        # /dev/null accepts the write but reads back empty (exit 11)
+        with pytest.raises(TargetStableError) as excinfo:
+            target.batch_write_values([('/dev/null', 'x')], as_root=as_root)
+        assert str(excinfo.value) == 'Could not set the value of /dev/null to "x" (read "")'
+
+        # Without verification, the same write succeeds
+        target.batch_write_values([('/dev/null', 'x')], verify=False, as_root=as_root)
+
+
+# pylint: disable=redefined-outer-name
+def test_file_exists_any(build_target_runners):
+    """
+    Test Target.file_exists_any()
+    """
+
+    logger.info('Running test_file_exists_any test...')
+
+    target_runners = build_target_runners
+    for target_runner in target_runners:
+        target = target_runner.target
+
+        with target.make_temp() as tempdir:
+            missing = [os.path.join(tempdir, 'missing{}'.format(i)) for i in range(2)]
+            assert not target.file_exists_any(missing)
+            assert target.file_exists_any(missing + [tempdir])
+            assert target.file_exists_any([missing[0], tempdir, missing[1]])
+
+        assert not target.file_exists_any([])